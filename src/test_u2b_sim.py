@@ -0,0 +1,61 @@
+# Simulator checks, run with python -m pytest from src
+
+import pytest
+import u2b_sim
+
+FRAME_TIME = 64 / 10_000_000 # 8 byte frame at 10 MHz
+SLV = 1
+
+
+def writeFrames(addr, words): # CMD_OUT payload of S-Port write frames to SLV
+    ctrl = u2b_sim.PWR_ON + u2b_sim.WR + (SLV << 4) + u2b_sim.S_PORT
+    return b''.join(bytes((0, 0, 0, ctrl, 0, addr, word // 256, word % 256)) for word in words)
+
+def readRequest(bsat, addr, now):
+    ctrl = u2b_sim.PWR_ON + (SLV << 4) + u2b_sim.S_PORT
+    bsat.frame(bytes((0, 0, 0, ctrl, u2b_sim.RD_NEXT, addr, 0, 0)), now)
+
+def state(bsat):
+    node = bsat.slaves[SLV]
+    return list(bsat.readFifo), bsat.fifoWords, bsat.overflows, list(node.mem), bytes(node.dlBuf)
+
+# bsat after the frames of payload one by one, as Device.clock sends them
+def oneByOne(bsat, payload, now):
+    for i in range(0, len(payload), 8):
+        now += FRAME_TIME
+        bsat.frame(payload[i:i + 8], now)
+    return now
+
+def compare(prepare, payload):
+    fast, slow = u2b_sim.Bsat(b'TEST'), u2b_sim.Bsat(b'TEST')
+    now = prepare(fast)
+    assert prepare(slow) == now
+    assert fast.frames(payload, now, FRAME_TIME) == pytest.approx(oneByOne(slow, payload, now))
+    later = now + 1.0 # everything drained
+    fast.drain(later)
+    slow.drain(later)
+    assert state(fast) == state(slow)
+
+
+def test_frames_write_without_reads():
+    compare(lambda bsat: 0.0, writeFrames(40, range(100)))
+
+def test_frames_write_pops_read_data():
+    def prepare(bsat): # read data waiting in the read fifo
+        for addr in (2, 3, 83):
+            readRequest(bsat, addr, 0.0)
+        bsat.drain(0.001)
+        assert len(bsat.readFifo) == 3
+        return 0.001
+    compare(prepare, writeFrames(40, range(2)))
+    compare(prepare, writeFrames(40, range(10)))
+
+def test_frames_write_with_outstanding_reads():
+    def prepare(bsat): # read requests still in the S-Port fifo
+        for addr in range(16):
+            readRequest(bsat, addr, 0.0)
+        return 0.0
+    compare(prepare, writeFrames(40, range(50)))
+
+def test_frames_download_overflow():
+    compare(lambda bsat: 0.0, writeFrames(u2b_sim.BSAT_WR_DL_ADDR, [i % 65536 for i in range(u2b_sim.FIFO_SIZE + 500)]))
@@ -1,6 +1,15 @@
-import ftd2xx as ftd  # usb
 import sys
 import os
+import time
+import itertools
+import threading
+import queue
+from array import array
+from concurrent.futures import Future
+if os.environ.get('U2B_SIM'):
+    import u2b_sim as ftd  # simulated adapter, see u2b_sim
+else:
+    import ftd2xx as ftd  # usb
 
 # HW config USB
 FTDI_TIMEOUT = 1000  # Timeout for D2XX read/write (msec)
@@ -10,6 +19,11 @@ SER_NR = b'5008-5758'
 # FTDI Command Processor for MPSSE (FTDI AN-108)
 CMD_OUT = 0x11  # Clock Data Bytes Out on -ve clock edge MSB first (no read)
 CMD_INOUT = 0x31  # out on -ve edge, in on +ve edge
+SET_BITS_LOW = 0x80  # Set data bits low byte (CS lines)
+SEND_IMMEDIATE = 0x87  # Flush chip buffer back to host, don't wait for latency timer
+CS0_N = 0x10  # low byte value with CS0_N active
+CS1_N = 0x08  # low byte value with CS1_N active
+CS_OFF = 0x18  # low byte value with both CS inactive
 
 # USB2BSAT FPGA related
 PWR_ON  = (1<<7)
@@ -20,6 +34,131 @@ PORT_1 = 1
 S_PORT = 2
 BUS_CTRL = 3
 RD_NEXT = 1 # read request for FPGA FIFO handling
+READ_BLOCK = 256 # max RD_NEXT requests outstanding in the FPGA FIFO
+READ_RETRIES = 1000 # USB transfers in a row without data valid before a read gives up
+WRITE_BLOCK = 8192 # S-Port frames per CMD_OUT (MPSSE maximum of 64k bytes)
+CS1_WRITE_BLOCK = 21845 # 3 byte CS1 frames per CMD_OUT
+
+# DeviceWorker job priorities, lower runs first
+PRIO_HIGH = 0 # port polling and user actions
+PRIO_NORMAL = 1
+PRIO_BULK = 2 # download chunks
+PRIO_STOP = 3
+
+# RegisterCache register classes
+VOLATILE = 0 # always read from the slave (ports, errors, MODE1)
+STATIC = 1 # read once, until invalidated (board type, UID, node info)
+WRITE_THROUGH = 2 # written to the slave, reads served from the last written value (masks)
+
+# Instrumentation
+#-----------------
+# Opt-in counters for the hot paths. While disabled (stats is None) every
+# instrumented function pays one global lookup, nothing else. Enable with
+# enableStats() or the environment variable U2B_STATS=1.
+HIST_BUCKETS = 21 # latency histogram, bucket i counts calls below 2**i usec
+
+class Stats:
+
+    def __init__(self):
+        self.lock = threading.Lock() # several DeviceWorkers may count at once
+        self.start = time.perf_counter()
+        self.usbWrites = 0
+        self.usbReads = 0
+        self.bytesOut = 0
+        self.bytesIn = 0
+        self.ops = {} # name: [calls, words, fifo polls, total seconds, histogram]
+
+    def usbWrite(self, nbytes):
+        with self.lock:
+            self.usbWrites += 1
+            self.bytesOut += nbytes
+
+    def usbRead(self, nbytes):
+        with self.lock:
+            self.usbReads += 1
+            self.bytesIn += nbytes
+
+    def op(self, name, seconds, words=0, polls=0):
+        bucket = min(int(seconds * 1e6).bit_length(), HIST_BUCKETS - 1)
+        with self.lock:
+            counter = self.ops.get(name)
+            if counter is None:
+                counter = self.ops[name] = [0, 0, 0, 0.0, [0] * HIST_BUCKETS]
+            counter[0] += 1
+            counter[1] += words
+            counter[2] += polls
+            counter[3] += seconds
+            counter[4][bucket] += 1
+
+    def snapshot(self): # consistent copy of all counters as plain dicts
+        with self.lock:
+            return {
+                'time': time.perf_counter() - self.start,
+                'usbWrites': self.usbWrites,
+                'usbReads': self.usbReads,
+                'bytesOut': self.bytesOut,
+                'bytesIn': self.bytesIn,
+                'ops': {name: {'calls': c[0], 'words': c[1], 'polls': c[2], 'seconds': c[3], 'hist': list(c[4])}
+                        for name, c in self.ops.items()},
+            }
+
+stats = None # Stats while instrumentation is enabled
+
+def enableStats(on=True): # returns the new Stats, counting starts from zero
+    global stats
+    stats = Stats() if on else None
+    return stats
+
+# Upper bound (sec) of the histogram bucket holding percentile p
+def histPercentile(hist, p):
+    limit = sum(hist) * p / 100
+    total = 0
+    for i, n in enumerate(hist):
+        total += n
+        if n and total >= limit:
+            return (2**i) / 1e6
+    return 0.0
+
+# Rates between two snapshots, prev=None counts from enableStats()
+def statsRates(snap, prev=None):
+    dt = snap['time'] - (prev['time'] if prev else 0) or 1e-9
+    old = prev or {'usbWrites': 0, 'usbReads': 0, 'bytesOut': 0, 'bytesIn': 0, 'ops': {}}
+    rates = {key: (snap[key] - old[key]) / dt for key in ('usbWrites', 'usbReads', 'bytesOut', 'bytesIn')}
+    rates['ops'] = {}
+    for name, op in snap['ops'].items():
+        was = old['ops'].get(name, {'calls': 0, 'polls': 0, 'hist': [0] * HIST_BUCKETS})
+        calls = op['calls'] - was['calls']
+        hist = [n - m for n, m in zip(op['hist'], was['hist'])]
+        rates['ops'][name] = {'calls/s': calls / dt, 'polls/call': (op['polls'] - was['polls']) / (calls or 1),
+                              'p50': histPercentile(hist, 50), 'p99': histPercentile(hist, 99)}
+    return rates
+
+def statsLine(rates): # one line summary of statsRates()
+    line = (f"usb w/s {rates['usbWrites']:.0f} r/s {rates['usbReads']:.0f} "
+            f"out {rates['bytesOut'] / 1000:.1f}kB/s in {rates['bytesIn'] / 1000:.1f}kB/s")
+    for name, op in rates['ops'].items():
+        if op['calls/s']:
+            line += f" | {name} {op['calls/s']:.0f}/s p50<{op['p50'] * 1000:.2f}ms p99<{op['p99'] * 1000:.2f}ms"
+            if op['polls/call']:
+                line += f" polls {op['polls/call']:.1f}"
+    return line
+
+# Print statsLine() every interval seconds from a daemon thread
+def logStats(interval=10, out=print):
+    def run():
+        prev = None
+        while stats:
+            time.sleep(interval)
+            snap = stats and stats.snapshot()
+            if snap:
+                out(statsLine(statsRates(snap, prev)))
+                prev = snap
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+if os.environ.get('U2B_STATS'):
+    enableStats()
 
 # Set mode (bitbang / MPSSE)
 def set_bitmode(d, bits, mode):
@@ -42,6 +181,8 @@ def set_spi_clock(d, hz):
 # Write list of integers as byte data
 def ft_write(d: object, data: object) -> object:
     s = str(bytearray(data)) if sys.version_info < (3,) else bytes(data)
+    if stats:
+        stats.usbWrite(len(s))
     return d.write(s)
 
 
@@ -51,28 +192,94 @@ def getStatus(d):
 
 # Write MPSSE command with word-value argument
 def write_cmd_bytes(d, cmd, data):
+    st = stats
+    if st:
+        start = time.perf_counter()
     n = len(data) - 1
     ft_write(d, [cmd, n % 256, n // 256] + list(data))
+    if st:
+        st.op('write_cmd_bytes', time.perf_counter() - start)
 
 # Read byte data into list of integers
 def read(d, nbytes):
     s = d.read(nbytes)
+    if stats:
+        stats.usbRead(len(s))
     return [ord(c) for c in s] if type(s) is str else list(s)
 
 # Activate CS0_N
 def activate_CS0_n(dev):
-    ft_write(dev, (0x80, 0x10, OPS))
+    ft_write(dev, (SET_BITS_LOW, CS0_N, OPS))
 
 # Activate CS1_N
 def activate_CS1_n(dev):
-    ft_write(dev, (0x80, 0x08, OPS))
+    ft_write(dev, (SET_BITS_LOW, CS1_N, OPS))
 
 # Deactivate CSx_N
 def reset_CSx_n(dev):
-    ft_write(dev, (0x80, 0x18, OPS))
+    ft_write(dev, (SET_BITS_LOW, CS_OFF, OPS))
+
+# MPSSE command batching
+#------------------------
+# Queues CS toggles and clock commands in one buffer. flush() sends the whole
+# buffer with a single D2XX write and collects all clocked-in bytes with a
+# single read, so one BSAT operation costs one USB round trip.
+class Transaction:
+
+    def __init__(self, dev):
+        self.dev = dev
+        self.txBuf = bytearray()
+        self.rxLen = 0 # bytes expected back from CMD_INOUT commands
+
+    def activateCS0(self):
+        self.txBuf += bytes((SET_BITS_LOW, CS0_N, OPS))
+
+    def activateCS1(self):
+        self.txBuf += bytes((SET_BITS_LOW, CS1_N, OPS))
+
+    def resetCS(self):
+        self.txBuf += bytes((SET_BITS_LOW, CS_OFF, OPS))
 
-# Open Device
-def openFTDI():
+    def cmdOut(self, data):
+        n = len(data) - 1
+        self.txBuf += bytes((CMD_OUT, n % 256, n // 256))
+        self.txBuf += bytes(data)
+
+    def cmdInOut(self, data): # returns offset of the clocked-in bytes in the flush() result
+        n = len(data) - 1
+        self.txBuf += bytes((CMD_INOUT, n % 256, n // 256))
+        self.txBuf += bytes(data)
+        offset = self.rxLen
+        self.rxLen += len(data)
+        return offset
+
+    # BSAT frames, see busCtrl, readSPort, writeSPort and updatePorts below
+    def busCtrl(self, wr, data):
+        ctrlByte = PWR_ON + (wr << 3) + BUS_CTRL
+        return self.cmdInOut((0, 0, 0, ctrlByte, 0, 0, data // 256, data % 256))
+
+    def writeSPort(self, slv, addr, data):
+        ctrlByte = PWR_ON + WR + ((slv & 0x7) << 4) + S_PORT
+        self.cmdOut((0, 0, 0, ctrlByte, 0, addr, data // 256, data % 256))
+
+    def flush(self): # returns the clocked-in bytes of all queued CMD_INOUT commands
+        rx = b''
+        if self.txBuf:
+            if self.rxLen:
+                self.txBuf.append(SEND_IMMEDIATE)
+            ft_write(self.dev, self.txBuf)
+            if self.rxLen:
+                rx = self.dev.read(self.rxLen)
+                if stats:
+                    stats.usbRead(len(rx))
+                if len(rx) < self.rxLen:
+                    raise IOError(f'FTDI read timeout ({len(rx)} of {self.rxLen} bytes)')
+        self.txBuf = bytearray()
+        self.rxLen = 0
+        return rx
+
+# Open Device, falls back to the first device if the default SER_NR is not there
+def openFTDI(serNr=SER_NR):
     devList = ftd.createDeviceInfoList()
     if devList < 1:
         print("no FTDI Device installed")
@@ -80,8 +287,10 @@ def openFTDI():
         for i in range(devList):
             print(ftd.getDeviceInfoDetail(i))
         try:
-            dev = ft_openEx(SER_NR)
+            dev = ft_openEx(serNr)
         except:
+            if serNr != SER_NR: # explicitly requested adapter
+                raise
             dev = ft_openEx(b'')
         if dev:
             print("FTDI device opened")
@@ -91,6 +300,15 @@ def openFTDI():
             ft_write(dev, (0x80, 0x18, OPS))  # Set outputs
             return(dev)
 
+# Serial numbers of all connected FTDI devices
+def listFTDI():
+    serials = []
+    for i in range(ftd.createDeviceInfoList()):
+        serNr = ftd.getDeviceInfoDetail(i)['serial']
+        if serNr:
+            serials.append(serNr)
+    return serials
+
 # common functions
 
 def resource_path(relative_path):
@@ -98,52 +316,296 @@ def resource_path(relative_path):
     base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
     return os.path.join(base_path, relative_path)
 
+# Run fn(dev, *args) with CS0_N / CS1_N active, CS is released afterwards
+def onCS0(dev, fn, *args):
+    activate_CS0_n(dev)
+    try:
+        return fn(dev, *args)
+    finally:
+        reset_CSx_n(dev)
+
+def onCS1(dev, fn, *args):
+    activate_CS1_n(dev)
+    try:
+        return fn(dev, *args)
+    finally:
+        reset_CSx_n(dev)
+
+# Device worker
+#---------------
+# The worker thread alone owns the FTDI handle. Jobs are functions fn(dev, *args)
+# which run one after the other from a priority queue, so a job is never torn
+# apart by another one. Each job has to leave CS inactive (see onCS0).
+# submit() returns a concurrent.futures.Future, call() waits for the result.
+# Don't call() from inside a job, this would deadlock the worker.
+class DeviceWorker(threading.Thread):
+
+    def __init__(self, dev):
+        super().__init__(daemon=True)
+        self.dev = dev
+        self.jobs = queue.PriorityQueue()
+        self.seq = itertools.count() # keeps FIFO order within one priority
+        self.start()
+
+    def submit(self, fn, *args, priority=PRIO_NORMAL):
+        future = Future()
+        self.jobs.put((priority, next(self.seq), fn, args, future))
+        return future
+
+    def call(self, fn, *args, priority=PRIO_NORMAL):
+        return self.submit(fn, *args, priority=priority).result()
+
+    def stop(self): # finishes all queued jobs first
+        self.jobs.put((PRIO_STOP, next(self.seq), None, (), None))
+
+    def run(self):
+        while True:
+            priority, seq, fn, args, future = self.jobs.get()
+            if fn is None:
+                break
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(self.dev, *args))
+            except Exception as e:
+                future.set_exception(e)
+
+# Register shadow
+#-----------------
+# Keeps STATIC and WRITE_THROUGH S-Port registers of every slave in memory, so
+# they cost no bus traffic once known. Unlisted registers are VOLATILE.
+# The methods block on the worker, call them from the GUI or a driver thread,
+# not from inside a worker job. invalidate() after rescan, reboot or download.
+class RegisterCache:
+
+    def __init__(self, worker, static=(), writeThrough=()):
+        self.worker = worker
+        self.regClass = dict.fromkeys(static, STATIC)
+        self.regClass.update(dict.fromkeys(writeThrough, WRITE_THROUGH))
+        self.invalidate()
+
+    def invalidate(self, slv=None): # forget one or all slaves
+        if slv is None:
+            self.shadow = [{} for i in range(8)]
+        else:
+            self.shadow[slv] = {}
+
+    def readSPortList(self, slv, addrs): # returns array('H') like u2b_base.readSPortList
+        shadow = self.shadow[slv]
+        missing = [addr for addr in addrs if addr not in shadow]
+        fresh = {}
+        if missing:
+            fresh = dict(zip(missing, self.worker.call(onCS0, readSPortList, slv, missing)))
+            for addr in missing:
+                if self.regClass.get(addr, VOLATILE) != VOLATILE:
+                    shadow[addr] = fresh[addr]
+        return array('H', [fresh[addr] if addr in fresh else shadow[addr] for addr in addrs])
+
+    def readSPort(self, slv, addr):
+        return self.readSPortList(slv, [addr])[0]
+
+    # Drops (addr, data) pairs already in the shadow, returns the writes still needed
+    def pending(self, slv, writes):
+        shadow = self.shadow[slv]
+        return [(addr, data) for addr, data in writes if shadow.get(addr) != data]
+
+    def written(self, slv, writes): # record writes done by a job
+        for addr, data in writes:
+            if self.regClass.get(addr, VOLATILE) != VOLATILE:
+                self.shadow[slv][addr] = data
+
+    def writeSPort(self, slv, addr, data):
+        self.worker.call(onCS0, writeSPort, slv, addr, data)
+        self.written(slv, [(addr, data)])
+
 # BSAT Bus control
 #------------------
 def busCtrl(dev, wr, data):
-    ctrlByte = PWR_ON + (wr << 3) + BUS_CTRL
-    hb = data // 256  # floor division
-    lb = data % 256  # modulus
-    txData = [0, 0, 0, ctrlByte, 0, 0, hb, lb]
-    write_cmd_bytes(dev, CMD_INOUT, txData) # set Address
-    rx = read(dev, 8)
+    st = stats
+    if st:
+        start = time.perf_counter()
+    t = Transaction(dev)
+    t.busCtrl(wr, data)
+    rx = t.flush()
+    if st:
+        st.op('busCtrl', time.perf_counter() - start)
     return(rx)
 
+# Rescan the BSAT bus, returns the bitmask of detected slaves (slv7..slv0)
+def scanBus(dev, timeout=2):
+    t = Transaction(dev)
+    t.activateCS0()
+    t.busCtrl(1, 0x0002) # disable continous autoscan, reset rescan bit (0)
+    t.busCtrl(1, 0xF003) # max scandelay, initialize rescan
+    t.busCtrl(1, 0x0002) # disable continous autoscan, reset rescan bit (0)
+    t.flush()
+    rx = [0, 0, 0, 0, 0, 0, 0, 0]
+    timeout_start = time.time()
+    while time.time() < timeout_start + timeout:
+        rx = busCtrl(dev, 0, 0)
+        if (rx[4] & 1 << 3):  # scan done?
+            break
+    else: # scan timeout
+        print('scan timeout')
+    reset_CSx_n(dev)
+    return(rx[5])
+
 # S-Port handling with FPGA FIFO
 #--------------------------------
 def readSPort(dev, slv, addr):
+    st = stats
+    if st:
+        start = time.perf_counter()
     ctrlByte = PWR_ON + ((slv & 0x7) << 4) + S_PORT
-    txData = [0, 0, 0, ctrlByte, RD_NEXT, addr, 0, 0]
-    write_cmd_bytes(dev, CMD_OUT, txData) # set Address
-    txData[4] = 0 # reset RD_NEXT
-    rx = [0, 0, 0, 0, 0, 0, 0, 0] # preinitialyze rx for first while loop
+    t = Transaction(dev)
+    t.cmdOut((0, 0, 0, ctrlByte, RD_NEXT, addr, 0, 0)) # set Address
+    txData = (0, 0, 0, ctrlByte, 0, addr, 0, 0) # RD_NEXT reset
+    t.cmdInOut(txData) # first poll goes out with the request
+    rx = t.flush()
+    polls = 0
     while (not (rx[5] & 1<<0)):  # read until data valid (fifo was not empty)
-        write_cmd_bytes(dev, CMD_INOUT, txData) # read Address
-        rx = read(dev, 8)
+        t.cmdInOut(txData) # read Address
+        rx = t.flush()
+        polls += 1
+    if st:
+        st.op('readSPort', time.perf_counter() - start, 1, polls)
     return(rx[6] * (2**8) + rx[7]) # returns integer value of 16bit
 
+# Read a list of S-Port addresses, returns array('H') in the same order.
+# RD_NEXT requests are clocked with CMD_INOUT, so every request frame also
+# collects a word from the FIFO once data is valid. Up to READ_BLOCK requests
+# are queued per USB transfer, the rest of the words is collected with polls.
+# Raises IOError if READ_RETRIES transfers in a row bring no data.
+def readSPortList(dev, slv, addrs):
+    st = stats
+    if st:
+        start = time.perf_counter()
+    ctrlByte = PWR_ON + ((slv & 0x7) << 4) + S_PORT
+    words = array('H')
+    t = Transaction(dev)
+    requested = 0
+    polls = 0
+    retries = 0
+    while len(words) < len(addrs):
+        outstanding = requested - len(words)
+        nReq = min(READ_BLOCK - outstanding, len(addrs) - requested)
+        for addr in addrs[requested:requested + nReq]:
+            t.cmdInOut((0, 0, 0, ctrlByte, RD_NEXT, addr & 0xFF, 0, 0)) # request and collect
+        requested += nReq
+        for i in range(max(outstanding + 1 - nReq, 1)):
+            t.cmdInOut((0, 0, 0, ctrlByte, 0, 0, 0, 0)) # collect only
+            polls += 1
+        rx = t.flush()
+        got = len(words)
+        for valid, hb, lb in zip(rx[5::8], rx[6::8], rx[7::8]):
+            if (valid & 1<<0) and len(words) < len(addrs): # data valid (fifo was not empty)
+                words.append(hb * (2**8) + lb)
+        retries = 0 if len(words) > got else retries + 1
+        if retries > READ_RETRIES:
+            raise IOError(f'S-Port read timeout, slave {slv} ({len(words)} of {len(addrs)} words)')
+    if st:
+        st.op('readSPortList', time.perf_counter() - start, len(words), polls)
+    return(words)
+
+# Read count words starting at addr
+def readSPortBlock(dev, slv, addr, count):
+    return(readSPortList(dev, slv, range(addr, addr + count)))
+
 def writeSPort(dev, slv, addr, data):
-    ctrlByte = PWR_ON + WR + ((slv & 0x7) << 4) + S_PORT
-    hb = data // 256  # floor division
-    lb = data % 256  # modulus
-    txData = [0, 0, 0, ctrlByte, 0, addr, hb, lb]
-    write_cmd_bytes(dev, CMD_OUT, txData) # set Address
+    st = stats
+    if st:
+        start = time.perf_counter()
+    t = Transaction(dev)
+    t.writeSPort(slv, addr, data)
+    t.flush()
+    if st:
+        st.op('writeSPort', time.perf_counter() - start, 1)
+
+# Big-endian byte string of 16bit words. bytes, bytearray and memoryview are
+# taken as they are (e.g. .rpd data), array('H') is converted from host order.
+def wordBytes(words):
+    if isinstance(words, array):
+        if sys.byteorder == 'little':
+            words = array(words.typecode, words)
+            words.byteswap()
+        return words.tobytes()
+    data = bytes(words)
+    if len(data) % 2: # odd length, pad last word
+        data += b'\x00'
+    return data
+
+# Build CMD_OUT commands writing all words to one S-Port address, or to
+# consecutive addresses with incAddr. Frames are filled with strided slice
+# assignments, no Python loop per word.
+def sPortWriteCmds(slv, addr, words, incAddr=False):
+    data = wordBytes(words)
+    count = len(data) // 2
+    ctrl = bytes((PWR_ON + WR + ((slv & 0x7) << 4) + S_PORT,))
+    cmds = bytearray(count * 8 + -(-count // WRITE_BLOCK) * 3)
+    pos = 0
+    for start in range(0, count, WRITE_BLOCK):
+        n = min(WRITE_BLOCK, count - start)
+        cmds[pos:pos + 3] = bytes((CMD_OUT, (n * 8 - 1) % 256, (n * 8 - 1) // 256))
+        end = pos + 3 + n * 8
+        cmds[pos + 6:end:8] = ctrl * n
+        if incAddr:
+            first = (addr + start) % 256
+            cmds[pos + 8:end:8] = (bytes(range(256)) * (n // 256 + 2))[first:first + n]
+        else:
+            cmds[pos + 8:end:8] = bytes((addr,)) * n
+        cmds[pos + 9:end:8] = data[start * 2:(start + n) * 2:2] # high bytes
+        cmds[pos + 10:end:8] = data[start * 2 + 1:(start + n) * 2:2] # low bytes
+        pos = end
+    return(cmds)
+
+# Build CMD_OUT commands writing all words to one adapter register on CS1,
+# 3 byte frames [addr, hb, lb]
+def cs1WriteCmds(addr, words):
+    data = wordBytes(words)
+    count = len(data) // 2
+    cmds = bytearray(count * 3 + -(-count // CS1_WRITE_BLOCK) * 3)
+    pos = 0
+    for start in range(0, count, CS1_WRITE_BLOCK):
+        n = min(CS1_WRITE_BLOCK, count - start)
+        cmds[pos:pos + 3] = bytes((CMD_OUT, (n * 3 - 1) % 256, (n * 3 - 1) // 256))
+        end = pos + 3 + n * 3
+        cmds[pos + 3:end:3] = bytes((addr,)) * n
+        cmds[pos + 4:end:3] = data[start * 2:(start + n) * 2:2] # high bytes
+        cmds[pos + 5:end:3] = data[start * 2 + 1:(start + n) * 2:2] # low bytes
+        pos = end
+    return(cmds)
+
+# Stream words to one S-Port address (e.g. BSAT_WR_DL_ADDR), one USB write per CMD_OUT
+def writeSPortBlock(dev, slv, addr, words, incAddr=False):
+    st = stats
+    if st:
+        start = time.perf_counter()
+    cmds = memoryview(sPortWriteCmds(slv, addr, words, incAddr))
+    for pos in range(0, len(cmds), WRITE_BLOCK * 8 + 3):
+        ft_write(dev, cmds[pos:pos + WRITE_BLOCK * 8 + 3])
+    if st:
+        st.op('writeSPortBlock', time.perf_counter() - start, len(words) if isinstance(words, array) else (len(words) + 1) // 2)
 
 # Port 0 and 1 read and write
 #-----------------------------
 def updatePorts(dev, slv, port0tx, port1tx): #Ports are 4 bytes
-    activate_CS0_n(dev)
+    st = stats
+    if st:
+        start = time.perf_counter()
+    t = Transaction(dev)
+    t.activateCS0()
     ctrlByte = PWR_ON + WR + ((slv & 0x7) << 4) + PORT_0 # select port0
-    txData = [0, 0, 0, ctrlByte, port0tx[3], port0tx[2], port0tx[1], port0tx[0]]
-    write_cmd_bytes(dev, CMD_OUT, txData)  # Port 0 write
+    t.cmdOut((0, 0, 0, ctrlByte, port0tx[3], port0tx[2], port0tx[1], port0tx[0]))  # Port 0 write
     ctrlByte = PWR_ON + WR + ((slv & 0x7) << 4) + PORT_1 # select port1
     txData = [0, 0, 0, ctrlByte, port1tx[3], port1tx[2], port1tx[1], port1tx[0]]
-    write_cmd_bytes(dev, CMD_INOUT, txData) # Port 0 read, Port 1 write
+    t.cmdInOut(txData) # Port 0 read, Port 1 write
     txData[3] &= RD # reset Write Bit
-    write_cmd_bytes(dev, CMD_INOUT, txData)  # Port 1 read
-    reset_CSx_n(dev)
-    rx = read(dev, 16)
+    t.cmdInOut(txData)  # Port 1 read
+    t.resetCS()
+    rx = t.flush()
     rx0 = rx[4], rx[5], rx[6], rx[7] # port 0
     rx1 = rx[12], rx[13], rx[14], rx[15] # port 1
     sumErr = ((rx[9] * 2**8) + rx[10]) # slv7(p1,p0),slv6(p1,p0)..slv0(p1,p0)
+    if st:
+        st.op('updatePorts', time.perf_counter() - start, 4)
     return([rx0, rx1], sumErr) # returns 2 * 4 byte + integer
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+
+# Transport benchmarks for the u2b_base hot paths.
+# Runs against the adapter found by u2b_base.openFTDI, or the simulator:
+#
+#   U2B_SIM=1 python u2b_bench.py
+#   python u2b_bench.py --save base.json      # keep numbers of this version
+#   python u2b_bench.py --compare base.json   # exit code 1 on a regression
+#
+# For every scenario ops/s, latency percentiles and the USB writes, reads and
+# bytes per operation are reported.
+
+import sys
+import time
+import json
+import argparse
+import u2b_base as u2b
+import u2b_flash
+import u2b_ports
+
+# BSAT_Memory_Map
+BSAT_MODE1 = 15
+BSAT_BOARD_TYPE = 83
+BSAT_NODE_INFO = 99
+BSAT_UID0 = 2
+BSAT_UID1 = 3
+S_USR_START = 0
+
+FW_SIZE = 1 << 20 # firmware stream scenario (bytes)
+TOLERANCE = 0.2 # allowed slow down against --compare
+
+
+# Passes everything to the FTDI handle and counts the USB transfers
+class CountingDevice:
+
+    def __init__(self, dev):
+        self.dev = dev
+        self.writes = 0
+        self.reads = 0
+        self.bytesOut = 0
+        self.bytesIn = 0
+
+    def write(self, data):
+        self.writes += 1
+        self.bytesOut += len(data)
+        return self.dev.write(data)
+
+    def read(self, nbytes):
+        data = self.dev.read(nbytes)
+        self.reads += 1
+        self.bytesIn += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.dev, name)
+
+
+# Scenarios
+#-----------
+def readWord(dev, slv):
+    u2b.onCS0(dev, u2b.readSPort, slv, BSAT_MODE1)
+
+def writeWord(dev, slv):
+    u2b.onCS0(dev, u2b.writeSPort, slv, S_USR_START, 0x1234)
+
+def busStatus(dev, slv):
+    u2b.onCS0(dev, u2b.busCtrl, 0, 0)
+
+def portUpdate(dev, slv):
+    u2b.updatePorts(dev, slv, [0, 0, 0, 0], [0, 0, 0, 0])
+
+def slaveInfo(dev, slv): # what getSlaveInfo reads
+    addrs = list(range(BSAT_BOARD_TYPE, BSAT_BOARD_TYPE + 16)) + [BSAT_NODE_INFO, BSAT_UID0, BSAT_UID1]
+    u2b.onCS0(dev, u2b.readSPortList, slv, addrs)
+
+def read256(dev, slv):
+    u2b.onCS0(dev, u2b.readSPortBlock, slv, S_USR_START, 256)
+
+def portPoll8(dev, slv): # ports of all 8 slaves in one transfer
+    u2b_ports.pollBus(dev, range(8))
+
+def firmwareStream(dev, slv): # download data only, no erase / program
+    image = bytes(FW_SIZE)
+    pos = 0
+    while pos < FW_SIZE:
+        pos = u2b_flash.streamDlBlocks(dev, slv, image, pos)
+
+# name: (function, default iterations, bytes of payload per operation)
+SCENARIOS = {
+    'readSPort': (readWord, 200, 2),
+    'writeSPort': (writeWord, 200, 2),
+    'busCtrl': (busStatus, 200, 0),
+    'updatePorts': (portUpdate, 200, 16),
+    'slaveInfo': (slaveInfo, 100, 38),
+    'read256': (read256, 50, 512),
+    'portPoll8': (portPoll8, 50, 128),
+    'firmware1M': (firmwareStream, 1, FW_SIZE),
+}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def runScenario(dev, name, slv, iterations=None):
+    fn, defIterations, payload = SCENARIOS[name]
+    iterations = iterations or defIterations
+    fn(dev, slv) # warm up
+    writes, reads, bytesOut, bytesIn = dev.writes, dev.reads, dev.bytesOut, dev.bytesIn
+    latency = []
+    start = time.perf_counter()
+    for i in range(iterations):
+        t = time.perf_counter()
+        fn(dev, slv)
+        latency.append(time.perf_counter() - t)
+    total = time.perf_counter() - start
+    return {
+        'ops/s': iterations / total,
+        'p50 ms': percentile(latency, 50) * 1000,
+        'p90 ms': percentile(latency, 90) * 1000,
+        'p99 ms': percentile(latency, 99) * 1000,
+        'writes/op': (dev.writes - writes) / iterations,
+        'reads/op': (dev.reads - reads) / iterations,
+        'out B/op': (dev.bytesOut - bytesOut) / iterations,
+        'in B/op': (dev.bytesIn - bytesIn) / iterations,
+        'payload kB/s': payload * iterations / total / 1000,
+    }
+
+def printResults(results):
+    cols = list(next(iter(results.values())))
+    print(f'{"scenario":<12}' + ''.join(f'{c:>13}' for c in cols))
+    for name, res in results.items():
+        print(f'{name:<12}' + ''.join(f'{res[c]:>13.2f}' for c in cols))
+
+def compare(results, fileName): # returns the scenarios slower than the saved ones
+    with open(fileName) as f:
+        base = json.load(f)
+    slower = []
+    for name, res in results.items():
+        if name in base and res['ops/s'] < base[name]['ops/s'] * (1 - TOLERANCE):
+            slower.append(name)
+            print(f'{name}: {res["ops/s"]:.1f} ops/s, was {base[name]["ops/s"]:.1f}')
+    return slower
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='USB2BSAT transport benchmarks')
+    parser.add_argument('scenarios', nargs='*', default=list(SCENARIOS), help=f'{", ".join(SCENARIOS)}')
+    parser.add_argument('-n', type=int, help='iterations per scenario')
+    parser.add_argument('--slave', type=int, default=0)
+    parser.add_argument('--save', help='write results to json file')
+    parser.add_argument('--compare', help='compare against json file')
+    args = parser.parse_args()
+
+    dev = CountingDevice(u2b.openFTDI())
+    results = {}
+    for name in args.scenarios:
+        results[name] = runScenario(dev, name, args.slave, args.n)
+    printResults(results)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=1)
+    if args.compare and compare(results, args.compare):
+        sys.exit(1)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+# S-Port memory dump, diff and restore. A dump is the whole S-Port address
+# space (256 words) of one slave, read in one pipelined block read:
+#
+#   python u2b_dump.py dump dumps/                 # all slaves, one file each
+#   python u2b_dump.py diff golden.bsd faulty.bsd
+#   python u2b_dump.py diff golden.bsd --slave 2   # against the live slave
+#   python u2b_dump.py restore golden.bsd --slave 2 [--dry-run]
+#
+# File: DUMP_HEADER (big-endian) followed by the words, big-endian.
+
+import os
+import sys
+import time
+import struct
+from array import array
+from collections import namedtuple
+import u2b_base as u2b
+
+# BSAT_Memory_Map
+BSAT_UID0 = 2
+BSAT_UID1 = 3
+BSAT_BOARD_TYPE = 83 # 16 words, board type and board number as text
+BSAT_NODE_INFO = 99
+
+SPORT_WORDS = 256 # 8 bit S-Port address
+DUMP_MAGIC = b'BSATDMP1'
+DUMP_HEADER = struct.Struct('>8sB32sHHdH') # magic, slave, board type + number, uid0, uid1, time.time(), words
+DUMP_EXT = '.bsd'
+# status, command, flash access and identity registers, never restored
+NO_RESTORE = {BSAT_UID0, BSAT_UID1, 14, 15, 16, 17, BSAT_NODE_INFO, *range(0x19, 0x21), 60, 61, 62,
+              68, 69, 70, 73, 74, 75, *range(BSAT_BOARD_TYPE, BSAT_BOARD_TYPE + 16)}
+
+Dump = namedtuple('Dump', 'slave boardType boardNmbr uid time words') # uid: (uid0, uid1), words: array('H')
+
+
+def boardText(words): # 8 words of two characters, 0 padded
+    return u2b.wordBytes(array('H', words)).replace(b'\0', b'').decode('latin1')
+
+# Read the whole S-Port space of slv (worker job)
+def readDump(dev, slv):
+    words = u2b.onCS0(dev, u2b.readSPortBlock, slv, 0, SPORT_WORDS)
+    ident = words[BSAT_BOARD_TYPE:BSAT_BOARD_TYPE + 16]
+    return Dump(slv, boardText(ident[:8]), boardText(ident[8:]), (words[BSAT_UID0], words[BSAT_UID1]),
+                time.time(), words)
+
+def saveDump(dump, fileName):
+    ident = u2b.wordBytes(dump.words[BSAT_BOARD_TYPE:BSAT_BOARD_TYPE + 16])
+    with open(fileName, 'wb') as f:
+        f.write(DUMP_HEADER.pack(DUMP_MAGIC, dump.slave, ident, dump.uid[0], dump.uid[1], dump.time, len(dump.words)))
+        f.write(u2b.wordBytes(dump.words))
+
+def loadDump(fileName):
+    with open(fileName, 'rb') as f:
+        data = f.read()
+    magic, slv, ident, uid0, uid1, t, count = DUMP_HEADER.unpack_from(data)
+    if magic != DUMP_MAGIC:
+        raise ValueError(f'{fileName}: no S-Port dump')
+    words = array('H', data[DUMP_HEADER.size:DUMP_HEADER.size + count * 2])
+    if sys.byteorder == 'little':
+        words.byteswap()
+    ident = array('H', ident)
+    if sys.byteorder == 'little':
+        ident.byteswap()
+    return Dump(slv, boardText(ident[:8]), boardText(ident[8:]), (uid0, uid1), t, words)
+
+def dumpName(dump): # slave position and board number, unique on one bus
+    return f'slave{dump.slave}_{dump.boardNmbr or "unknown"}{DUMP_EXT}'
+
+# [(addr, word a, word b)] of all addresses which differ
+def diffDumps(a, b, skip=()):
+    return [(addr, x, y) for addr, (x, y) in enumerate(zip(a.words, b.words)) if x != y and addr not in skip]
+
+# Write the words of dump which differ from the live slave, returns the writes
+def restoreDump(worker, slv, dump, skip=NO_RESTORE, dryRun=False):
+    live = worker.call(readDump, slv)
+    writes = [(addr, word) for addr, old, word in diffDumps(live, dump, skip)]
+    if writes and not dryRun:
+        worker.call(writeWords, slv, writes)
+    return writes
+
+def writeWords(dev, slv, writes): # all writes in one USB transfer
+    t = u2b.Transaction(dev)
+    t.activateCS0()
+    for addr, data in writes:
+        t.writeSPort(slv, addr, data)
+    t.resetCS()
+    t.flush()
+
+def printDiff(diff, a='a', b='b'):
+    for addr, x, y in diff:
+        print(f'{addr:3} 0x{addr:02X}: {x:04X} {y:04X}')
+    print(f'{len(diff)} words differ ({a} / {b})')
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='S-Port memory dump, diff and restore')
+    parser.add_argument('--serial', help='adapter serial number')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p = sub.add_parser('dump', help='dump slaves to dir')
+    p.add_argument('dir')
+    p.add_argument('--slaves', type=int, nargs='*', help='default: all on the bus')
+    p = sub.add_parser('diff', help='diff two dumps, or a dump and a live slave')
+    p.add_argument('a')
+    p.add_argument('b', nargs='?')
+    p.add_argument('--slave', type=int)
+    p = sub.add_parser('restore', help='write the words which differ back to a slave')
+    p.add_argument('file')
+    p.add_argument('--slave', type=int, required=True)
+    p.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    if args.cmd == 'diff' and args.b:
+        printDiff(diffDumps(loadDump(args.a), loadDump(args.b)), args.a, args.b)
+        sys.exit()
+    if args.cmd == 'diff' and args.slave is None:
+        parser.error('diff needs two files or --slave')
+    worker = u2b.DeviceWorker(u2b.openFTDI(args.serial.encode() if args.serial else u2b.SER_NR))
+    if args.cmd == 'dump':
+        slaves = args.slaves or [i for i in range(8) if worker.call(u2b.scanBus) & 1 << i]
+        os.makedirs(args.dir, exist_ok=True)
+        for slv in slaves:
+            dump = worker.call(readDump, slv)
+            saveDump(dump, os.path.join(args.dir, dumpName(dump)))
+            print(f'slave {slv}: {dump.boardType} {dump.boardNmbr} -> {dumpName(dump)}')
+    elif args.cmd == 'diff':
+        printDiff(diffDumps(loadDump(args.a), worker.call(readDump, args.slave)), args.a, f'slave {args.slave}')
+    else:
+        writes = restoreDump(worker, args.slave, loadDump(args.file), dryRun=args.dry_run)
+        for addr, data in writes:
+            print(f'{addr:3} 0x{addr:02X} <- {data:04X}')
+        print(f'{len(writes)} words {"to write" if args.dry_run else "written"}')
+    worker.stop()
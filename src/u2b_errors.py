@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+# Bus-wide port error monitor. Counts the sumErr bits of every slave and port
+# over time, reads the error registers of a port once its sumErr bit comes up
+# and keeps a rolling per-second history:
+#
+#   monitor = ErrorMonitor(worker, historyFile='errors.npz')
+#   poller.subscribe(monitor.update)            # u2b_ports.BusPoller snapshots
+#   monitor.add(time.perf_counter_ns(), slaves, sumErr)   # or any sumErr
+#   for line in monitor.report(): print(line)
+#
+# sumErr bit slv * 2 + port stays set until the error registers are reset, a
+# burst is a run of polls with the bit set. Times kept and saved are wall clock
+# (time.time_ns()), an existing history file is loaded and continued.
+
+import os
+import time
+import threading
+import numpy as np
+import u2b_base as u2b
+
+# BSAT_Memory_Map
+BSAT_PORT_STATUS = [68, 73] # for Port [0, 1]
+BSAT_ERR_PORT_0 = [69, 74] # errors 15..0
+BSAT_ERR_PORT_1 = [70, 75] # errors 31..16
+
+HISTORY = 3600 # seconds of history
+SAVE_INTERVAL = 60 # seconds between history file writes
+COUNTERS = ('polls', 'errPolls', 'bursts', 'maxBurst', 'first', 'last', 'errBits') # saved with the history
+
+
+# Error registers (status, errors 31..0) of the given ports, one pipelined read per slave
+def readPortErrors(dev, ports):
+    result = {}
+    for slv in sorted({slv for slv, port in ports}):
+        slvPorts = [port for s, port in ports if s == slv]
+        addrs = [addr for port in slvPorts for addr in (BSAT_PORT_STATUS[port], BSAT_ERR_PORT_0[port], BSAT_ERR_PORT_1[port])]
+        words = u2b.onCS0(dev, u2b.readSPortList, slv, addrs)
+        for i, port in enumerate(slvPorts):
+            status, err0, err1 = words[i * 3:i * 3 + 3]
+            result[(slv, port)] = (status, err0 + (err1 << 16))
+    return result
+
+
+class ErrorMonitor:
+
+    def __init__(self, worker, historyFile=None, history=HISTORY):
+        self.worker = worker
+        self.historyFile = historyFile
+        self.lock = threading.Lock()
+        # counters [slv, port]
+        self.polls = np.zeros((8, 2), np.int64) # polls of the slave
+        self.errPolls = np.zeros((8, 2), np.int64) # polls with sumErr set
+        self.bursts = np.zeros((8, 2), np.int64)
+        self.burst = np.zeros((8, 2), np.int64) # length of the running burst
+        self.maxBurst = np.zeros((8, 2), np.int64)
+        self.first = np.zeros((8, 2), np.int64) # time.time_ns() of the first / last error, 0: none
+        self.last = np.zeros((8, 2), np.int64)
+        self.errBits = np.zeros((8, 2, 32), np.int64) # error register bits seen at the burst starts
+        self.status = {} # (slv, port): (time, status, errors) of the last register read
+        # rolling history, one row per second: polls of the bus, error polls per slv * 2 + port
+        self.histTime = np.zeros(history, np.int64) # seconds (time.time())
+        self.histPolls = np.zeros(history, np.uint32)
+        self.histErr = np.zeros((history, 16), np.uint32)
+        self.second = None
+        self.row = -1
+        self.lastSave = time.perf_counter()
+        self.wallOffset = time.time_ns() - time.perf_counter_ns() # perf_counter_ns() to time.time_ns()
+        if historyFile and os.path.exists(self.historyPath()):
+            self.load()
+
+    def update(self, snap): # u2b_ports.Snapshot
+        self.add(snap.time, snap.slaves, snap.sumErr)
+
+    # one sumErr read at t (perf_counter_ns) with slaves present on the bus
+    def add(self, t, slaves, sumErr):
+        t += self.wallOffset
+        slaves = np.asarray(slaves, np.intp)
+        err = (sumErr >> np.arange(16)) & 1
+        err = err.reshape(8, 2).astype(bool)
+        present = np.zeros(8, bool)
+        present[slaves] = True
+        present = np.repeat(present[:, None], 2, axis=1)
+        err &= present
+        with self.lock:
+            self.polls += present
+            self.errPolls += err
+            started = err & (self.burst == 0)
+            self.bursts += started
+            self.burst = np.where(err, self.burst + 1, 0)
+            np.maximum(self.maxBurst, self.burst, out=self.maxBurst)
+            self.first[err & (self.first == 0)] = t
+            self.last[err] = t
+            self.addHistory(t, err)
+        if started.any(): # details of the new errors, without blocking the poller
+            ports = [(int(slv), int(port)) for slv, port in zip(*started.nonzero())]
+            future = self.worker.submit(readPortErrors, ports)
+            future.add_done_callback(lambda f: self.addDetails(t, f))
+        if self.historyFile and time.perf_counter() - self.lastSave > SAVE_INTERVAL:
+            self.save(self.historyFile)
+
+    def addHistory(self, t, err):
+        second = t // 1_000_000_000
+        if second != self.second:
+            self.second = second
+            self.row = (self.row + 1) % len(self.histTime)
+            self.histTime[self.row] = second
+            self.histPolls[self.row] = 0
+            self.histErr[self.row] = 0
+        self.histPolls[self.row] += 1
+        self.histErr[self.row] += err.reshape(16)
+
+    def addDetails(self, t, future): # runs in the worker thread
+        if future.exception():
+            return
+        with self.lock:
+            for (slv, port), (status, errors) in future.result().items():
+                self.status[(slv, port)] = (t, status, errors)
+                self.errBits[slv, port] += (errors >> np.arange(32)) & 1
+
+    def history(self): # (seconds, polls, errors[:, slv * 2 + port]) oldest first
+        with self.lock:
+            idx = (np.arange(1, len(self.histTime) + 1) + self.row) % len(self.histTime)
+            valid = self.histPolls[idx] > 0
+            return self.histTime[idx][valid], self.histPolls[idx][valid], self.histErr[idx][valid]
+
+    def historyPath(self): # np.savez adds .npz
+        return self.historyFile if self.historyFile.endswith('.npz') else self.historyFile + '.npz'
+
+    def save(self, fileName):
+        self.lastSave = time.perf_counter()
+        seconds, polls, errors = self.history()
+        with self.lock:
+            counters = {name: getattr(self, name).copy() for name in COUNTERS}
+        np.savez_compressed(fileName, seconds=seconds, histPolls=polls, histErr=errors, **counters)
+
+    def load(self): # counters and history of an earlier run
+        with np.load(self.historyPath()) as saved, self.lock:
+            for name in COUNTERS:
+                getattr(self, name)[...] = saved[name]
+            n = min(len(saved['seconds']), len(self.histTime))
+            if n:
+                self.histTime[:n] = saved['seconds'][-n:]
+                self.histPolls[:n] = saved['histPolls'][-n:]
+                self.histErr[:n] = saved['histErr'][-n:]
+                self.row = n - 1
+                self.second = int(self.histTime[self.row])
+
+    def reset(self, slv=None, port=None): # counters of one port, one slave or all
+        idx = (slice(None) if slv is None else slv, slice(None) if port is None else port)
+        with self.lock:
+            for counter in (self.polls, self.errPolls, self.bursts, self.burst, self.maxBurst, self.first,
+                            self.last, self.errBits):
+                counter[idx] = 0
+
+    def portLine(self, slv, port, now=None): # error counters of one port as text
+        now = now or time.time_ns()
+        if not self.errPolls[slv, port]:
+            return f'slave {slv} port {port}: no errors in {self.polls[slv, port]} polls'
+        rate = self.errPolls[slv, port] / self.polls[slv, port]
+        bits = ','.join(str(b) for b in self.errBits[slv, port].nonzero()[0])
+        return (f'slave {slv} port {port}: {rate:.2%} of {self.polls[slv, port]} polls, '
+                f'{self.bursts[slv, port]} bursts (max {self.maxBurst[slv, port]}), '
+                f'first {(now - self.first[slv, port]) / 1e9:.0f} s ago, '
+                f'last {(now - self.last[slv, port]) / 1e9:.0f} s ago'
+                + (f', error bits {bits}' if bits else ''))
+
+    def report(self): # one line per port which had errors
+        now = time.time_ns()
+        with self.lock:
+            return [self.portLine(slv, port, now) for slv, port in zip(*self.errPolls.nonzero())]
+
+
+if __name__ == '__main__':
+    import argparse
+    import u2b_ports
+    parser = argparse.ArgumentParser(description='watch the port errors of all BSAT slaves')
+    parser.add_argument('--history', help='.npz history file, rewritten every minute')
+    parser.add_argument('--interval', type=float, default=0.1, help='poll interval (s)')
+    parser.add_argument('--report', type=float, default=10, help='report interval (s)')
+    args = parser.parse_args()
+    worker = u2b.DeviceWorker(u2b.openFTDI())
+    slaves = [i for i in range(8) if worker.call(u2b.scanBus) & 1 << i]
+    monitor = ErrorMonitor(worker, args.history)
+    poller = u2b_ports.BusPoller(worker, slaves, args.interval)
+    poller.subscribe(monitor.update)
+    try:
+        while True:
+            time.sleep(args.report)
+            print('\n'.join(monitor.report()) or 'no errors', flush=True)
+    except KeyboardInterrupt:
+        poller.stop()
+        if args.history:
+            monitor.save(args.history)
@@ -0,0 +1,656 @@
+#!/usr/bin/env python
+
+# Firmware download to BSAT slaves over USB2BSAT (CS0) and to the adapter
+# itself (CS1). All device access goes through a u2b_base.DeviceWorker, so
+# port polling keeps running between the download jobs.
+
+import os
+import mmap
+import json
+import time
+import zlib
+import hashlib
+import tempfile
+import contextlib
+from array import array
+import u2b_base as u2b
+
+# BSAT_Memory_Map
+BSAT_UID0 = 2
+BSAT_UID1 = 3
+BSAT_MODE1 = 15
+BSAT_CTRL0 = 16
+BSAT_CTRL1 = 17
+WR_AD_Flash_LSB = 0x19
+WR_AD_Flash_MSB = 0x1A
+BSAT_WR_DL_ADDR = 27
+WR_AD_Flash_Data = 0x1C
+RD_AD_Flash_LSB = 0x1D
+RD_AD_Flash_MSB = 0x1E
+RD_AD_Flash_Data = 0x20
+BSAT_BOARD_NMBR = 91 # 16 words, second half of the board type block
+
+# Flash ranges (CTRL0 bits 6..4) and their byte address in the configuration flash
+RANGE_AUX = 1
+RANGE_STD = 2
+RANGE_MFD = 7
+FLASH_BASE = {RANGE_AUX: 0x000000, RANGE_STD: 0x400000, RANGE_MFD: 0xFF0000}
+
+# BSAT_MODE1 status bits
+ERASE_DONE = (1 << 15)
+DL_DONE = (1 << 14)
+
+# CTRL0 unlock sequences, erase gets the flash range added (range << 4)
+ERASE_SEQ = [0xFF00, 0xDA00, 0x9100, 0x2000, 0xC000, 0x8700, 0xAA00]
+REBOOT_SEQ = [0x9100, 0x2000, 0xC000, 0x8700, 0xAA00, 0xF100, 0x6000]
+FLASH_UNLOCK_SEQ = [0x8400, 0x8B00, 0x3600, 0x4A00, 0xB600, 0x4D00, 0x1B00] # flash range access (MFD)
+
+DL_BLOCK = 4000 # bytes per burst, fifo has at least 2k words free when less than half full
+JOB_TIME = 0.02 # max seconds one download job keeps the worker, port polling runs in between
+PROGRESS_INTERVAL = 0.1 # min seconds between progress reports
+FLASH_WR_BLOCK = 1200 # bytes per addressed write burst, 3 fifo words per flash word
+JOURNAL_EXT = '.journal' # download journal, one per adapter, slave and board in JOURNAL_DIR
+CACHE_DIR = os.environ.get('U2B_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.u2b_cache'))
+JOURNAL_DIR = os.path.join(CACHE_DIR, 'journal')
+CACHE_MAX = int(os.environ.get('U2B_CACHE_MAX', 256 << 20)) # bytes of compiled images kept, least recently used go first
+DL_BURST = 3 + DL_BLOCK // 2 * 8 # wire bytes of one DL_BLOCK: CMD_OUT header and 8 byte frames
+CS1_DL_BLOCK = 16384 # bytes per adapter download chunk, the adapter status is read after each
+MANIFEST_DIR = os.environ.get('U2B_MANIFEST_DIR', os.path.join(os.path.expanduser('~'), '.u2b_manifest'))
+MFD_SIZE = 512 # bytes of manufacturing data at the start of RANGE_MFD
+
+
+# Write a list of words to CTRL0 in one USB transfer
+def writeCtrl0(dev, slv, words):
+    t = u2b.Transaction(dev)
+    t.activateCS0()
+    for word in words:
+        t.writeSPort(slv, BSAT_CTRL0, word)
+    t.resetCS()
+    t.flush()
+
+# Poll BSAT_MODE1 until one of the bits in mask is set, returns False on timeout
+def waitMode1(worker, slv, mask, timeout=5):
+    return slv in waitMode1All(worker, [slv], mask, timeout)
+
+# Same for several slaves at once, returns the set of slaves which got there
+def waitMode1All(worker, slaves, mask, timeout=5):
+    done = set()
+    timeout_start = time.time()
+    while time.time() < timeout_start + timeout and len(done) < len(slaves):
+        for slv in slaves:
+            if slv not in done:
+                nMode_1 = worker.call(u2b.onCS0, u2b.readSPort, slv, BSAT_MODE1)
+                if (nMode_1 & mask):
+                    done.add(slv)
+    return done
+
+# Stream image[pos:] to the download address for up to JOB_TIME, returns the new
+# position. Every burst goes out in one USB write together with the busCtrl
+# status read for the next one, so the fifo is topped up as soon as it is
+# less than half full.
+# wire is the compiled image of the slave (see wireImage), if there is one.
+def streamDlBlocks(dev, slv, image, pos, wire=None):
+    return streamDlBlocksAll(dev, image, {slv: pos}, wire and {slv: wire})[slv]
+
+# streamDlBlocks for several slaves, positions is {slv: pos}. Each burst goes to
+# the slave which is furthest behind, so they all share the fifo evenly.
+# wires is {slv: compiled image}. Returns the new positions.
+def streamDlBlocksAll(dev, image, positions, wires=None):
+    positions = dict(positions)
+    deadline = time.perf_counter() + JOB_TIME
+    t = u2b.Transaction(dev)
+    t.activateCS0()
+    t.busCtrl(0, 0)
+    rx = t.flush()
+    while time.perf_counter() < deadline:
+        slv = min(positions, key=positions.get)
+        pos = positions[slv]
+        if pos >= len(image):
+            break
+        if not (rx[7] & 0x01): # fifo less than half full
+            if wires:
+                burst = pos // DL_BLOCK * DL_BURST
+                t.txBuf += wires[slv][burst:burst + DL_BURST]  # Firmware Download, precompiled
+            else:
+                t.txBuf += u2b.sPortWriteCmds(slv, BSAT_WR_DL_ADDR, image[pos:pos + DL_BLOCK])  # Firmware Download
+            positions[slv] = min(pos + DL_BLOCK, len(image))
+        t.busCtrl(0, 0) # fifo status after this burst
+        rx = t.flush()
+    u2b.reset_CSx_n(dev)
+    return positions
+
+# Write a file through a unique temp file in the same directory, renamed to
+# path when the block is done, so concurrent writers never see half a file
+@contextlib.contextmanager
+def replaceFile(path, mode='wb'):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+        raise
+
+# Image cache
+#-------------
+# The S-Port frames of a download only depend on image and slave, so an image
+# is compiled once to the CMD_OUT bursts streamDlBlocks sends (one DL_BURST per
+# DL_BLOCK) and kept in CACHE_DIR under its hash and target. Returns the file name.
+def wireImage(image, slv, imageHash=None):
+    imageHash = imageHash or hashlib.sha1(image).hexdigest()
+    path = os.path.join(CACHE_DIR, f'{imageHash}.slv{slv}.cs0.dl{DL_BLOCK}.mpsse')
+    if os.path.exists(path):
+        os.utime(path) # recently used
+    else:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with replaceFile(path) as f:
+            for pos in range(0, len(image), DL_BLOCK):
+                f.write(u2b.sPortWriteCmds(slv, BSAT_WR_DL_ADDR, image[pos:pos + DL_BLOCK]))
+        trimCache(keep=path)
+    return path
+
+# Remove the least recently used compiled images above CACHE_MAX bytes
+def trimCache(keep=None):
+    entries = []
+    for entry in os.scandir(CACHE_DIR):
+        if entry.name.endswith('.mpsse') and entry.path != keep:
+            st = entry.stat()
+            entries.append((st.st_mtime, st.st_size, entry.path))
+    total = sum(size for mtime, size, path in entries) + (os.path.getsize(keep) if keep else 0)
+    for mtime, size, path in sorted(entries):
+        if total <= CACHE_MAX:
+            break
+        with contextlib.suppress(OSError): # mapped by a running download (Windows)
+            os.remove(path)
+            total -= size
+
+# Map the compiled images of all slaves, returns {slv: mmap}. They stay mapped
+# until stack (a contextlib.ExitStack) is closed.
+def openWireImages(stack, image, slaves):
+    imageHash = hashlib.sha1(image).hexdigest()
+    wires = {}
+    for slv in slaves:
+        f = stack.enter_context(open(wireImage(image, slv, imageHash), 'rb'))
+        wires[slv] = stack.enter_context(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    return wires
+
+# Stream a whole image (bytes-like, e.g. an mmap) to the download address.
+# progress(percent) and rate(bytes/s) are called at most every PROGRESS_INTERVAL,
+# the journal (if any) is saved with them. Returns the crc32 of the streamed data.
+def downloadImage(worker, slv, image, progress=None, rate=None, journal=None, wire=None):
+    size = len(image)
+    pos = 0
+    crc = 0
+    start = lastReport = time.perf_counter()
+    while pos < size:
+        newPos = worker.call(streamDlBlocks, slv, image, pos, wire, priority=u2b.PRIO_BULK)
+        crc = zlib.crc32(image[pos:newPos], crc)
+        pos = newPos
+        now = time.perf_counter()
+        if now - lastReport >= PROGRESS_INTERVAL or pos == size:
+            lastReport = now
+            if journal:
+                journal.update(streamed=pos).save()
+            if progress:
+                progress(100 * pos // size)
+            if rate:
+                rate(pos / (now - start))
+    return crc
+
+# Read count bytes of flash from byte address addr, returns bytes.
+# Every flash word takes the address writes and an RD_NEXT request through the
+# S-Port fifo, up to READ_BLOCK requests are queued per USB transfer. All
+# frames are clocked with CMD_INOUT, every S-Port frame takes a word off the
+# read fifo, so the data is collected from the address writes as well.
+# Raises IOError after u2b.READ_RETRIES transfers without data. Run it with CS0 active.
+def readFlash(dev, slv, addr, count):
+    ctrlByte = u2b.PWR_ON + ((slv & 0x7) << 4) + u2b.S_PORT
+    wrCtrlByte = ctrlByte + u2b.WR
+    nWords = (count + 1) // 2
+    words = array('H')
+    t = u2b.Transaction(dev)
+    requested = 0
+    retries = 0
+    while len(words) < nWords:
+        outstanding = requested - len(words)
+        nReq = min(u2b.READ_BLOCK - outstanding, nWords - requested)
+        for ad in range(addr + requested * 2, addr + (requested + nReq) * 2, 2):
+            t.cmdInOut((0, 0, 0, wrCtrlByte, 0, RD_AD_Flash_LSB, (ad >> 8) & 0xFF, ad & 0xFF))
+            t.cmdInOut((0, 0, 0, wrCtrlByte, 0, RD_AD_Flash_MSB, ad >> 24, (ad >> 16) & 0xFF))
+            t.cmdInOut((0, 0, 0, ctrlByte, u2b.RD_NEXT, RD_AD_Flash_Data, 0, 0)) # request and collect
+        requested += nReq
+        for i in range(max(outstanding + 1 - nReq * 3, 1)):
+            t.cmdInOut((0, 0, 0, ctrlByte, 0, 0, 0, 0)) # collect only
+        rx = t.flush()
+        got = len(words)
+        for valid, hb, lb in zip(rx[5::8], rx[6::8], rx[7::8]):
+            if (valid & 1<<0) and len(words) < nWords: # data valid (fifo was not empty)
+                words.append(hb * (2**8) + lb)
+        retries = 0 if len(words) > got else retries + 1
+        if retries > u2b.READ_RETRIES:
+            raise IOError(f'flash read timeout, slave {slv} ({len(words)} of {nWords} words)')
+    return u2b.wordBytes(words)[:count]
+
+# Read count bytes from offset of flash range sys (RANGE_AUX, RANGE_STD, RANGE_MFD)
+def readFlashRange(dev, slv, sys, count, offset=0):
+    return readFlash(dev, slv, FLASH_BASE[sys] + offset, count)
+
+# Manufacturing data up to the first erased word, in one pipelined read. Run it with CS0 active.
+def readMFD(dev, slv):
+    data = readFlashRange(dev, slv, RANGE_MFD, MFD_SIZE)
+    end = next((i for i in range(0, len(data), 2) if data[i:i + 2] == b'\xff\xff'), len(data))
+    return data[:end]
+
+# Program data (at most FLASH_WR_BLOCK bytes) at byte address addr through the
+# addressed flash write, like the MFD write. The flash has to be erased there.
+def writeFlashBlock(dev, slv, addr, data):
+    data = u2b.wordBytes(data)
+    t = u2b.Transaction(dev)
+    t.activateCS0()
+    t.busCtrl(0, 0)
+    while t.flush()[7] & 0x01: # wait for room in the fifo
+        t.busCtrl(0, 0)
+    for word in FLASH_UNLOCK_SEQ:  # Unlock Sequence 1..7
+        t.writeSPort(slv, BSAT_CTRL0, word)
+    t.writeSPort(slv, BSAT_CTRL1, 1 << 14)  # Unlock Request
+    for i in range(0, len(data), 2):
+        t.writeSPort(slv, WR_AD_Flash_LSB, (addr + i) & 0xFFFF)
+        t.writeSPort(slv, WR_AD_Flash_MSB, (addr + i) >> 16)
+        t.writeSPort(slv, WR_AD_Flash_Data, data[i] * (2**8) + data[i + 1])
+    t.writeSPort(slv, BSAT_CTRL1, 1 << 15)  # lock Request
+    t.resetCS()
+    t.flush()
+
+# Read back image from flash range sys in DL_BLOCK jobs, starting at the
+# journal's verified position. Returns False on the first block which differs.
+def verifyFlash(worker, slv, sys, image, progress=None, journal=None):
+    pos = journal['verified'] if journal else 0
+    lastReport = time.perf_counter()
+    while pos < len(image):
+        block = image[pos:pos + DL_BLOCK]
+        data = worker.call(u2b.onCS0, readFlash, slv, FLASH_BASE[sys] + pos, len(block), priority=u2b.PRIO_BULK)
+        if zlib.crc32(data) != zlib.crc32(block):
+            return False
+        pos += len(block)
+        if journal:
+            journal['verified'] = pos
+        if time.perf_counter() - lastReport >= PROGRESS_INTERVAL or pos == len(image):
+            lastReport = time.perf_counter()
+            if journal:
+                journal.save()
+            if progress:
+                progress(100 * pos // len(image))
+    return True
+
+# Download journal
+#------------------
+# Records how far a download got, so a restart with the same image can skip
+# what is already in flash. Phases: 'erase', 'download' (streamed bytes),
+# 'programmed' (download done, verified bytes). Removed after the reboot.
+# Kept in JOURNAL_DIR under the adapter serial, slave and board number, the
+# board identity (board number, UID0, UID1) is checked on load.
+class Journal(dict):
+
+    def __init__(self, serNr, slv, sys, size, crc, identity):
+        boardNmbr, uid = identity
+        super().__init__(range=sys, size=size, crc=crc, board=[boardNmbr, *uid], phase='erase', streamed=0, verified=0)
+        self.path = os.path.join(JOURNAL_DIR, f'{safeName(serNr)}.slv{slv}.{safeName(boardNmbr) or "unknown"}.range{sys}{JOURNAL_EXT}')
+
+    def load(self): # True if a journal of this image, range and board exists, it is taken over then
+        try:
+            with open(self.path) as f:
+                old = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if old.get('board') != self['board']: # another board in the slot, its flash is unknown
+            self.remove()
+            return False
+        if any(old.get(key) != self[key] for key in ('range', 'size', 'crc')):
+            return False
+        self.update(old)
+        return True
+
+    def update(self, *args, **kw):
+        super().update(*args, **kw)
+        return self
+
+    def save(self):
+        os.makedirs(JOURNAL_DIR, exist_ok=True)
+        with replaceFile(self.path, 'w') as f:
+            json.dump(self, f)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+# Continue an interrupted download. Returns True if the image is in flash
+# afterwards (not verified yet), False if a full download is needed.
+# If the streamed part is found in flash the rest goes through the addressed
+# flash write, which takes 3 fifo words per flash word: only worth it for the
+# last third of the image.
+def resumeDownload(worker, slv, sys, image, journal, progress=None):
+    if journal['phase'] == 'programmed':
+        return True
+    if journal['phase'] != 'download':
+        return False
+    size = len(image)
+    pos = journal['streamed'] - journal['streamed'] % DL_BLOCK
+    if pos < size * 2 // 3:
+        return False
+    last = max(pos - DL_BLOCK, 0) # was the stream programmed up to here?
+    data = worker.call(u2b.onCS0, readFlash, slv, FLASH_BASE[sys] + last, pos - last, priority=u2b.PRIO_BULK)
+    if data != image[last:pos]:
+        return False
+    while pos < size:
+        block = image[pos:pos + FLASH_WR_BLOCK]
+        worker.call(writeFlashBlock, slv, FLASH_BASE[sys] + pos, block, priority=u2b.PRIO_BULK)
+        pos += len(block)
+        if progress:
+            progress(100 * pos // size)
+    return True
+
+# Erase, download, verify and reboot one slave. progress(percent) and
+# rate(bytes/s) are called from this thread, so run it off the GUI thread and
+# hand them over by Qt signals. A journal in JOURNAL_DIR lets a failed
+# download resume (see resumeDownload), verify=False skips the flash readback.
+# The board's delta update manifest is removed, and written again after a
+# verified flash.
+def flashFirmware(worker, slv, sys, fileName, progress=None, rate=None, verify=True):
+    with open(fileName, 'rb') as in_file:
+        with mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ) as image:
+            crc = zlib.crc32(image)
+            identity = slaveIdentity(worker, slv)
+            journal = Journal(worker.call(adapterSerial), slv, sys, len(image), crc, identity)
+            manifest = boardManifest(identity[0], sys)
+            if manifest:
+                manifest.remove() # the flash content changes from here on
+            if not (journal.load() and resumeDownload(worker, slv, sys, image, journal, progress)):
+                with contextlib.ExitStack() as stack:
+                    wire = openWireImages(stack, image, [slv])[slv] # compiled or taken from the cache
+                    # ****** Erase Section ******
+                    journal.update(phase='erase', streamed=0, verified=0).save()
+                    worker.call(writeCtrl0, slv, [word + (sys << 4) for word in ERASE_SEQ] + [(sys << 4) + (1 << 0)])
+                    if not waitMode1(worker, slv, ERASE_DONE):
+                        return False # erase timeout
+                    # ****** Download Section ******
+                    journal.update(phase='download').save()
+                    if downloadImage(worker, slv, image, progress, rate, journal, wire) != crc:
+                        return False # file changed while streaming
+                worker.call(writeCtrl0, slv, [(sys << 4) + (1 << 3)])  # Download Data End
+                if not waitMode1(worker, slv, DL_DONE):
+                    return False # prog timeout
+            journal.update(phase='programmed').save()
+            # ****** Verify Section ******
+            if verify and not verifyFlash(worker, slv, sys, image, progress, journal):
+                journal.update(phase='erase').save() # flash content is wrong, start over
+                return False
+            blocks = blockHashes(image)
+    # ****** Reboot Section ******
+    worker.call(writeCtrl0, slv, REBOOT_SEQ + [0x6000 + (1 << 1)])
+    journal.remove()
+    time.sleep(1) # wait for reboot
+    if manifest and verify:
+        manifest.save(slaveIdentity(worker, slv)[1], blocks)
+    return True
+
+# Flash the same image to several slaves of one bus. Erase, programming and
+# reboot run on all slaves at the same time, the download bursts are
+# interleaved (see streamDlBlocksAll), so the bus fifo stays the only limit.
+# progress(slv, percent) is called from this thread. Manifests are handled
+# like in flashFirmware. Returns {slv: ok}.
+def flashFirmwareAll(worker, slaves, sys, fileName, progress=None, verify=True):
+    results = dict.fromkeys(slaves, False)
+    with open(fileName, 'rb') as in_file:
+        with mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ) as image, contextlib.ExitStack() as stack:
+            size = len(image)
+            crc = zlib.crc32(image)
+            serNr = worker.call(adapterSerial)
+            identities = {slv: slaveIdentity(worker, slv) for slv in slaves}
+            journals = {slv: Journal(serNr, slv, sys, size, crc, identities[slv]) for slv in slaves}
+            manifests = {slv: boardManifest(identities[slv][0], sys) for slv in slaves}
+            for manifest in filter(None, manifests.values()):
+                manifest.remove() # the flash content changes from here on
+            wires = openWireImages(stack, image, slaves) # compiled or taken from the cache, closed on any return
+            # ****** Erase Section ******
+            for slv in slaves:
+                journals[slv].save()
+                worker.call(writeCtrl0, slv, [word + (sys << 4) for word in ERASE_SEQ] + [(sys << 4) + (1 << 0)])
+            erased = waitMode1All(worker, slaves, ERASE_DONE)
+            # ****** Download Section ******
+            positions = {slv: 0 for slv in slaves if slv in erased}
+            for slv in positions:
+                journals[slv].update(phase='download').save()
+            lastReport = time.perf_counter()
+            while positions and min(positions.values()) < size:
+                positions = worker.call(streamDlBlocksAll, image, positions, wires, priority=u2b.PRIO_BULK)
+                if time.perf_counter() - lastReport >= PROGRESS_INTERVAL or min(positions.values()) == size:
+                    lastReport = time.perf_counter()
+                    for slv, pos in positions.items():
+                        journals[slv].update(streamed=pos).save()
+                        if progress:
+                            progress(slv, 100 * pos // size)
+            if zlib.crc32(image) != crc:
+                return results # file changed while streaming
+            for slv in positions:
+                worker.call(writeCtrl0, slv, [(sys << 4) + (1 << 3)])  # Download Data End
+            programmed = waitMode1All(worker, list(positions), DL_DONE)
+            # ****** Verify Section ******
+            for slv in programmed:
+                journals[slv].update(phase='programmed').save()
+                results[slv] = not verify or verifyFlash(worker, slv, sys, image,
+                                                         progress and (lambda percent, slv=slv: progress(slv, percent)), journals[slv])
+                if not results[slv]:
+                    journals[slv].update(phase='erase').save() # flash content is wrong, start over
+            blocks = blockHashes(image)
+    # ****** Reboot Section ******
+    for slv in slaves:
+        if results[slv]:
+            worker.call(writeCtrl0, slv, REBOOT_SEQ + [0x6000 + (1 << 1)])
+            journals[slv].remove()
+    time.sleep(1) # wait for reboot
+    for slv in slaves:
+        if results[slv] and manifests[slv] and verify:
+            manifests[slv].save(slaveIdentity(worker, slv)[1], blocks)
+    return results
+
+# Delta update
+#--------------
+# A manifest per board and flash range keeps the block hashes of the image
+# flashed last. The flash can only be erased as a whole range, so a changed
+# block is written in place only if it just clears bits (e.g. the erased part
+# behind a shorter old image), anything else needs the full download.
+def blockHashes(image):
+    return [hashlib.sha1(image[pos:pos + DL_BLOCK]).hexdigest() for pos in range(0, len(image), DL_BLOCK)]
+
+# Board number and (UID0, UID1) of the running firmware
+def slaveIdentity(worker, slv):
+    words = worker.call(u2b.onCS0, u2b.readSPortList, slv, list(range(BSAT_BOARD_NMBR, BSAT_BOARD_NMBR + 8)) + [BSAT_UID0, BSAT_UID1])
+    boardNmbr = u2b.wordBytes(words[:8]).rstrip(b'\0').decode('ascii', 'replace')
+    return boardNmbr, (words[8], words[9])
+
+def adapterSerial(dev): # serial number of the adapter (worker job)
+    return dev.getDeviceInfo()['serial'].decode('ascii', 'replace')
+
+def safeName(text): # text as part of a file name
+    return ''.join(c if c.isalnum() or c in '-_' else '_' for c in text)
+
+class Manifest:
+
+    def __init__(self, boardNmbr, sys):
+        self.path = os.path.join(MANIFEST_DIR, f'{safeName(boardNmbr)}.range{sys}.json')
+
+    def load(self, uid): # block hashes, None if unknown or flashed by someone else since
+        try:
+            with open(self.path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if tuple(manifest.get('uid', ())) != tuple(uid):
+            return None
+        return manifest['blocks']
+
+    def save(self, uid, blocks):
+        os.makedirs(MANIFEST_DIR, exist_ok=True)
+        with replaceFile(self.path, 'w') as f:
+            json.dump({'uid': list(uid), 'blocks': blocks}, f)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+# UID0/1 are firmware ids, not per board, so a board without board number gets
+# no manifest and its flash is always read back.
+def boardManifest(boardNmbr, sys):
+    return Manifest(boardNmbr, sys) if boardNmbr else None
+
+# Offsets of the DL_BLOCKs of image which are not in flash. Without a manifest
+# the flash is read back. Returns None if flash holds more than the image.
+def changedBlocks(worker, slv, sys, image, old):
+    new = blockHashes(image)
+    if old is None:
+        old = []
+        for pos in range(0, len(image) + DL_BLOCK, DL_BLOCK): # one block behind the image must be erased
+            data = worker.call(u2b.onCS0, readFlash, slv, FLASH_BASE[sys] + pos, DL_BLOCK, priority=u2b.PRIO_BULK)
+            if data.count(0xFF) == len(data):
+                break
+            if data[len(image) - pos:].count(0xFF) != len(data[len(image) - pos:]):
+                return None # old image is longer
+            old.append(hashlib.sha1(data[:len(image) - pos]).hexdigest())
+    if len(old) > len(new):
+        return None
+    return [i * DL_BLOCK for i, h in enumerate(new) if i >= len(old) or old[i] != h]
+
+# True if all changed blocks can be programmed without erase (bits only cleared)
+def programmable(worker, slv, sys, image, changed):
+    for pos in changed:
+        block = image[pos:pos + DL_BLOCK]
+        old = worker.call(u2b.onCS0, readFlash, slv, FLASH_BASE[sys] + pos, len(block), priority=u2b.PRIO_BULK)
+        if int.from_bytes(old, 'big') & int.from_bytes(block, 'big') != int.from_bytes(block, 'big'):
+            return False
+    return True
+
+# Update slave firmware with as little flash traffic as possible: nothing if the
+# image is in flash already, in place writes of the changed blocks if they can
+# be programmed and are less than a third of the image (3 fifo words per flash
+# word), else flashFirmware, which keeps the manifest itself. Returns True
+# when the image is in flash.
+def updateFirmware(worker, slv, sys, fileName, progress=None, rate=None):
+    boardNmbr, uid = slaveIdentity(worker, slv)
+    manifest = boardManifest(boardNmbr, sys)
+    with open(fileName, 'rb') as in_file:
+        with mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ) as image:
+            blocks = blockHashes(image)
+            changed = changedBlocks(worker, slv, sys, image, manifest and manifest.load(uid))
+            if changed == []:
+                if progress:
+                    progress(100)
+                if manifest:
+                    manifest.save(uid, blocks)
+                return True # unchanged, no reboot
+            inPlace = (changed is not None and len(changed) * DL_BLOCK * 3 < len(image)
+                       and programmable(worker, slv, sys, image, changed))
+            if inPlace:
+                for n, pos in enumerate(changed):
+                    end = min(pos + DL_BLOCK, len(image))
+                    for wrPos in range(pos, end, FLASH_WR_BLOCK):
+                        worker.call(writeFlashBlock, slv, FLASH_BASE[sys] + wrPos, image[wrPos:min(wrPos + FLASH_WR_BLOCK, end)],
+                                    priority=u2b.PRIO_BULK)
+                    data = worker.call(u2b.onCS0, readFlash, slv, FLASH_BASE[sys] + pos, end - pos, priority=u2b.PRIO_BULK)
+                    if data != image[pos:end]:
+                        return False
+                    if progress:
+                        progress(100 * (n + 1) // len(changed))
+    if not inPlace:
+        return flashFirmware(worker, slv, sys, fileName, progress, rate)
+    worker.call(writeCtrl0, slv, REBOOT_SEQ + [0x6000 + (1 << 1)])
+    time.sleep(1) # wait for reboot
+    if manifest:
+        manifest.save(slaveIdentity(worker, slv)[1], blocks)
+    return True
+
+# Adapter self download (CS1)
+#-----------------------------
+# The adapter's registers are written with 3 byte frames [addr, hb, lb], the
+# data of an address comes back with the next frame. There is no fifo status
+# on CS1: the download goes in CS1_DL_BLOCK chunks, each one in the same USB
+# transfer as a BSAT_MODE1 read, and stops if the adapter lost its erased state.
+
+# Write words to an adapter register in one USB transfer
+def writeAdapter(dev, addr, words):
+    t = u2b.Transaction(dev)
+    t.activateCS1()
+    t.txBuf += u2b.cs1WriteCmds(addr, array('H', words))
+    t.resetCS()
+    t.flush()
+
+def readAdapter(dev, addr):
+    t = u2b.Transaction(dev)
+    t.activateCS1()
+    t.cmdOut((addr, 0, 0)) # set Address
+    t.cmdInOut((addr, 0, 0)) # read Address
+    t.resetCS()
+    rx = t.flush()
+    return rx[1] * (2**8) + rx[2]
+
+def waitAdapterMode1(worker, mask, timeout=5):
+    timeout_start = time.time()
+    while time.time() < timeout_start + timeout:
+        if worker.call(readAdapter, BSAT_MODE1) & mask:
+            return True
+    return False
+
+# Stream image[pos:] to the adapter for up to JOB_TIME, returns the new position
+# or None if the adapter is not in download state anymore
+def streamAdapterBlocks(dev, image, pos):
+    deadline = time.perf_counter() + JOB_TIME
+    t = u2b.Transaction(dev)
+    t.activateCS1()
+    while pos < len(image) and time.perf_counter() < deadline:
+        t.txBuf += u2b.cs1WriteCmds(BSAT_WR_DL_ADDR, image[pos:pos + CS1_DL_BLOCK])  # Firmware Download
+        pos += CS1_DL_BLOCK
+        t.cmdOut((BSAT_MODE1, 0, 0)) # adapter status
+        t.cmdInOut((BSAT_MODE1, 0, 0))
+        rx = t.flush()
+        if not (rx[1] & ERASE_DONE >> 8):
+            pos = None
+            break
+    u2b.reset_CSx_n(dev)
+    return pos if pos is None else min(pos, len(image))
+
+# Erase, download and reboot the adapter FPGA. sys is the flash range,
+# progress(percent) is called at most every PROGRESS_INTERVAL from this thread.
+def flashAdapter(worker, sys, fileName, progress=None, rate=None):
+    # ****** Erase Section ******
+    worker.call(writeAdapter, BSAT_CTRL0, [word + (sys << 4) for word in ERASE_SEQ] + [0xAA00 + (sys << 4) + (1 << 0)])
+    if not waitAdapterMode1(worker, ERASE_DONE):
+        return False # erase timeout
+    # ****** Download Section ******
+    with open(fileName, 'rb') as in_file:
+        with mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ) as image:
+            size = len(image)
+            pos = 0
+            start = lastReport = time.perf_counter()
+            while pos < size:
+                pos = worker.call(streamAdapterBlocks, image, pos, priority=u2b.PRIO_BULK)
+                if pos is None:
+                    return False # adapter left download state
+                now = time.perf_counter()
+                if now - lastReport >= PROGRESS_INTERVAL or pos == size:
+                    lastReport = now
+                    if progress:
+                        progress(100 * pos // size)
+                    if rate:
+                        rate(pos / (now - start))
+    worker.call(writeAdapter, BSAT_CTRL0, [(sys << 4) + (1 << 3)])  # Download Data End
+    if not waitAdapterMode1(worker, DL_DONE):
+        return False # prog timeout
+    # ****** Reboot Section ******
+    worker.call(writeAdapter, BSAT_CTRL0, [word + (sys << 4) for word in REBOOT_SEQ] + [(sys << 4) + (1 << 1)])
+    time.sleep(1) # wait for reboot
+    return True
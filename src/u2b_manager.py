@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+# Drive several USB2BSAT adapters from one asyncio event loop.
+# Every adapter gets its own u2b_base.DeviceWorker, so the adapters work in
+# parallel while the jobs on one adapter stay in order:
+#
+#   async def main():
+#       manager = DeviceManager()
+#       slaves = await manager.gather(lambda bus: bus.scanBus())
+#       word = await manager.buses[serNr].readSPort(0, 83)
+
+import asyncio
+import u2b_base as u2b
+import u2b_flash
+
+
+class BsatBus:
+
+    def __init__(self, serNr):
+        self.serNr = serNr
+        self.worker = u2b.DeviceWorker(u2b.openFTDI(serNr))
+
+    async def run(self, fn, *args, priority=u2b.PRIO_NORMAL): # await any worker job fn(dev, *args)
+        return await asyncio.wrap_future(self.worker.submit(fn, *args, priority=priority))
+
+    async def scanBus(self):
+        return await self.run(u2b.scanBus, priority=u2b.PRIO_HIGH)
+
+    async def readSPort(self, slv, addr):
+        return await self.run(u2b.onCS0, u2b.readSPort, slv, addr)
+
+    async def readSPortList(self, slv, addrs):
+        return await self.run(u2b.onCS0, u2b.readSPortList, slv, addrs)
+
+    async def readSPortBlock(self, slv, addr, count):
+        return await self.run(u2b.onCS0, u2b.readSPortBlock, slv, addr, count)
+
+    async def writeSPort(self, slv, addr, data):
+        return await self.run(u2b.onCS0, u2b.writeSPort, slv, addr, data)
+
+    async def writeSPortBlock(self, slv, addr, words, incAddr=False):
+        return await self.run(u2b.onCS0, u2b.writeSPortBlock, slv, addr, words, incAddr)
+
+    async def updatePorts(self, slv, port0tx, port1tx):
+        return await self.run(u2b.updatePorts, slv, port0tx, port1tx, priority=u2b.PRIO_HIGH)
+
+    # flashFirmware waits on the worker, so it runs in the loop's thread pool
+    async def flashFirmware(self, slv, sys, fileName, progress=None, rate=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, u2b_flash.flashFirmware, self.worker, slv, sys, fileName, progress, rate)
+
+    def close(self):
+        self.worker.stop()
+        self.worker.join()
+        self.worker.dev.close()
+
+
+class DeviceManager:
+
+    def __init__(self, serials=None): # opens all connected adapters by default
+        if serials is None:
+            serials = u2b.listFTDI()
+        self.buses = {serNr: BsatBus(serNr) for serNr in serials}
+
+    # Run coroutine function fn(bus) on all adapters at once, returns {serNr: result}
+    async def gather(self, fn):
+        results = await asyncio.gather(*(fn(bus) for bus in self.buses.values()))
+        return dict(zip(self.buses, results))
+
+    def close(self):
+        for bus in self.buses.values():
+            bus.close()
+
+
+# Scan the BSAT bus on every connected adapter
+async def scanAll():
+    manager = DeviceManager()
+    try:
+        slaves = await manager.gather(lambda bus: bus.scanBus())
+        for serNr, scaned in slaves.items():
+            print(f'{serNr}: slaves {[i for i in range(8) if scaned & 1 << i]}')
+    finally:
+        manager.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(scanAll())
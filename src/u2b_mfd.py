@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+
+# Manufacturing data (MFD) of many boards. Programs the MFD of every slave
+# which has a row in a CSV or SQLite table, on all connected adapters, and
+# exports the MFD of all boards as an inventory:
+#
+#   python u2b_mfd.py program boards.csv           # or boards.db --table mfd
+#   python u2b_mfd.py inventory inventory.csv      # or inventory.db
+#
+# Table columns are the MFD_FIELDS names after 'Map ID'. A row belongs to the
+# slave with the same S-Port board number, or to the one in its 'Slave' column
+# (and 'Adapter', the serial number, if there are several adapters).
+
+import os
+import csv
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import u2b_base as u2b
+import u2b_flash
+
+MFD_FIELDS = ['Map ID', 'Board Number', 'Board Index', 'Board Name', 'Board ID', 'Supplier Lot', 'Supplier Name',
+              'Date of manufacture', 'Configuration', 'Test Location', 'FPGA Design Number', 'Test Date',
+              'Board History', 'Test ID']
+MAP_ID = bytes((1, 0)) # MANU_MAP_ID, stored as numbers
+CR = 13
+
+
+# MFD bytes of the text fields after 'Map ID', every field ends with CR
+def encodeMFD(fields):
+    data = bytearray(MAP_ID + bytes((CR,)))
+    for text in fields:
+        data += bytes(ord(char) for char in text if char.isascii())
+        data.append(CR)
+    if len(data) % 2: # odd length, pad with 0
+        data.append(0)
+    if len(data) > u2b_flash.MFD_SIZE:
+        raise ValueError(f'manufacturing data has {len(data)} bytes, max {u2b_flash.MFD_SIZE}')
+    return bytes(data)
+
+# The MFD_FIELDS texts of MFD bytes
+def decodeMFD(data):
+    fields = [''] * len(MFD_FIELDS)
+    actVal = 0
+    actStr = ''
+    for value in data:
+        if (value == CR):
+            if (actVal < len(fields)):
+                fields[actVal] = actStr
+            actVal += 1
+            actStr = ''
+        elif (32 <= value <= 126): # only ascii chars allowed
+            actStr += chr(value)
+        elif (value <= 9): # MAP_ID is stored as number
+            actStr += str(value)
+    return fields
+
+# Erase and program the MFD of several slaves, {slv: data}. All erases run
+# at once, readback with the pipelined flash read. Returns {slv: ok}.
+def programMFD(worker, mfd, verify=True):
+    results = dict.fromkeys(mfd, False)
+    base = u2b_flash.FLASH_BASE[u2b_flash.RANGE_MFD]
+    for slv in mfd:
+        worker.call(u2b_flash.writeCtrl0, slv, [word + (u2b_flash.RANGE_MFD << 4) for word in u2b_flash.FLASH_UNLOCK_SEQ]
+                                             + [0x0000 + (u2b_flash.RANGE_MFD << 4) + (1 << 0)])  # erase Request
+    erased = u2b_flash.waitMode1All(worker, list(mfd), u2b_flash.ERASE_DONE)
+    for slv in erased:
+        worker.call(u2b_flash.writeFlashBlock, slv, base, mfd[slv], priority=u2b.PRIO_BULK)
+    for slv in erased:
+        results[slv] = not verify or worker.call(u2b.onCS0, u2b_flash.readFlash, slv, base, len(mfd[slv])) == mfd[slv]
+    return results
+
+# Rows of a .csv file (header line with the column names) or of an SQLite table
+def loadTable(fileName, table='mfd'):
+    if os.path.splitext(fileName)[1].lower() == '.csv':
+        with open(fileName, newline='') as csvfile:
+            return [dict(row) for row in csv.DictReader(csvfile)]
+    with sqlite3.connect(fileName) as db:
+        db.row_factory = sqlite3.Row
+        return [{key: '' if row[key] is None else str(row[key]) for key in row.keys()}
+                for row in db.execute(f'SELECT * FROM "{table}"')]
+
+# {slv: row} of the slaves on one adapter, boards is {slv: S-Port board number}
+def matchRows(rows, boards, serNr=''):
+    matched = {}
+    for slv, boardNmbr in boards.items():
+        for row in rows:
+            if boardNmbr and row.get('Board Number') == boardNmbr:
+                matched[slv] = row
+                break
+            if row.get('Slave', '') != '' and int(row['Slave']) == slv and row.get('Adapter', serNr) in ('', serNr):
+                matched.setdefault(slv, row) # board number match goes first
+    return matched
+
+# Rows which are not among the matched ones, e.g. a board not on the bus
+def unmatchedRows(rows, matched):
+    ids = {id(row) for row in matched}
+    return [row for row in rows if id(row) not in ids]
+
+def rowText(row): # short description of a table row for messages
+    return row.get('Board Number') or f'slave {row.get("Slave") or "?"} {row.get("Adapter", "")}'.rstrip()
+
+# {slv: S-Port board number} of the slaves on the bus, scaned is the bitmask
+# of a scan already done (the GUI's), else the bus is scanned
+def busBoards(worker, scaned=None):
+    if scaned is None:
+        scaned = worker.call(u2b.scanBus, priority=u2b.PRIO_HIGH)
+    return {slv: u2b_flash.slaveIdentity(worker, slv)[0] for slv in range(8) if scaned & 1 << slv}
+
+# Program the slaves of one adapter which have a row, returns {slv: (board number, ok, row)}.
+# serNr is the adapter's serial number, rows of another adapter are left out.
+def programBus(worker, rows, serNr='', verify=True, scaned=None):
+    boards = busBoards(worker, scaned)
+    matched = matchRows(rows, boards, serNr)
+    mfd = {slv: encodeMFD([row.get(field, '') for field in MFD_FIELDS[1:]]) for slv, row in matched.items()}
+    results = programMFD(worker, mfd, verify)
+    return {slv: (boards[slv], ok, matched[slv]) for slv, ok in results.items()}
+
+# MFD of all slaves of one adapter, one dict per board
+def readInventory(worker, serNr='', scaned=None):
+    inventory = []
+    for slv, boardNmbr in busBoards(worker, scaned).items():
+        fields = decodeMFD(worker.call(u2b.onCS0, u2b_flash.readMFD, slv))
+        inventory.append({'Adapter': serNr, 'Slave': slv, 'S-Port Board Number': boardNmbr,
+                          **dict(zip(MFD_FIELDS, fields))})
+    return inventory
+
+def exportInventory(inventory, fileName):
+    columns = ['Adapter', 'Slave', 'S-Port Board Number'] + MFD_FIELDS
+    if os.path.splitext(fileName)[1].lower() == '.csv':
+        with open(fileName, 'w', newline='') as csvfile:
+            writer = csv.DictWriter(csvfile, columns)
+            writer.writeheader()
+            writer.writerows(inventory)
+        return
+    with sqlite3.connect(fileName) as db:
+        db.execute('DROP TABLE IF EXISTS inventory')
+        db.execute('CREATE TABLE inventory (' + ', '.join(f'"{c}"' for c in columns) + ')')
+        db.execute('CREATE INDEX inventory_board ON inventory ("Board Number")')
+        db.executemany('INSERT INTO inventory VALUES (' + ', '.join('?' * len(columns)) + ')',
+                       [[board[c] for c in columns] for board in inventory])
+
+# Run fn(worker, serNr) on all adapters at once, returns {serNr: result}
+def onAllAdapters(fn):
+    serials = u2b.listFTDI()
+    lock = threading.Lock() # openFTDI prints the device list
+    def run(serNr):
+        with lock:
+            worker = u2b.DeviceWorker(u2b.openFTDI(serNr))
+        try:
+            return fn(worker, serNr.decode())
+        finally:
+            worker.stop()
+    with ThreadPoolExecutor(len(serials) or 1) as pool:
+        return dict(zip((serNr.decode() for serNr in serials), pool.map(run, serials)))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='batch manufacturing data of BSAT boards')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p = sub.add_parser('program', help='program the MFD of all slaves with a row in the table')
+    p.add_argument('fileName', help='.csv or SQLite file')
+    p.add_argument('--table', default='mfd', help='SQLite table')
+    p.add_argument('--no-verify', action='store_true')
+    p = sub.add_parser('inventory', help='export the MFD of all boards')
+    p.add_argument('fileName', help='.csv or SQLite file')
+    args = parser.parse_args()
+
+    if args.cmd == 'program':
+        rows = loadTable(args.fileName, args.table)
+        results = onAllAdapters(lambda worker, serNr: programBus(worker, rows, serNr, not args.no_verify))
+        for serNr, boards in results.items():
+            for slv, (boardNmbr, ok, row) in sorted(boards.items()):
+                print(f'{serNr} slave {slv} {boardNmbr}: {"ok" if ok else "failed"}')
+        print(f'{sum(ok for boards in results.values() for b, ok, row in boards.values())} boards programmed')
+        for row in unmatchedRows(rows, [row for boards in results.values() for b, ok, row in boards.values()]):
+            print(f'no slave for row {rowText(row)}')
+    else:
+        inventory = [board for boards in onAllAdapters(readInventory).values() for board in boards]
+        exportInventory(inventory, args.fileName)
+        print(f'{len(inventory)} boards -> {args.fileName}')
@@ -0,0 +1,371 @@
+#!/usr/bin/env python
+
+# Port 0 / port 1 of all slaves on the BSAT bus in one USB transfer.
+#
+#   poller = BusPoller(worker, slaves=[0, 1, 2])
+#   poller.subscribe(lambda snap: print(snap.ports[:, 0]))
+#
+# A snapshot holds ports as a NumPy array of shape (slaves, 2) uint32, bit 0
+# of port 0 is ports[i, 0] & 1, and the sumErr word of the bus.
+
+import time
+import threading
+from collections import namedtuple, deque
+import numpy as np
+import u2b_base as u2b
+
+Snapshot = namedtuple('Snapshot', 'time slaves ports sumErr') # time: perf_counter_ns() after the transfer
+Edge = namedtuple('Edge', 'time slv port bit rising') # time of the snapshot which has the new level
+
+
+# Port frames of all slaves. Each port frame returns the port selected by the
+# frame before, so the frames are chained and one extra read frame collects the
+# last port: 2 * slaves + 1 frames, 16 bytes back per slave.
+# outputs is {slv: (port0tx, port1tx)} like updatePorts, other slaves are only read.
+def pollBus(dev, slaves, outputs=None):
+    outputs = outputs or {}
+    t = u2b.Transaction(dev)
+    t.activateCS0()
+    first = True
+    for slv in slaves:
+        tx = outputs.get(slv)
+        for port in (u2b.PORT_0, u2b.PORT_1):
+            ctrlByte = u2b.PWR_ON + ((slv & 0x7) << 4) + port
+            txData = (0, 0, 0, ctrlByte, 0, 0, 0, 0)
+            if tx:
+                ctrlByte += u2b.WR
+                txData = (0, 0, 0, ctrlByte, tx[port][3], tx[port][2], tx[port][1], tx[port][0])
+            if first:
+                t.cmdOut(txData)
+                first = False
+            else:
+                t.cmdInOut(txData)
+    t.cmdInOut((0, 0, 0, u2b.PWR_ON + ((slaves[-1] & 0x7) << 4) + u2b.PORT_1, 0, 0, 0, 0)) # last port read
+    t.resetCS()
+    rx = t.flush()
+    frames = np.frombuffer(rx, dtype=np.uint8).reshape(-1, 8)
+    ports = frames[:, 4:8].copy().view('>u4').reshape(len(slaves), 2).astype(np.uint32)
+    sumErr = int(frames[-1, 1]) * 2**8 + int(frames[-1, 2]) # slv7(p1,p0),slv6(p1,p0)..slv0(p1,p0)
+    return Snapshot(time.perf_counter_ns(), np.array(slaves, dtype=np.uint8), ports, sumErr)
+
+
+# Poll interval which follows the activity on the ports:
+#   fast     while bits change or outputs are set, for IDLE_AFTER seconds
+#   doubled  with every static poll after that, up to slow
+#   hidden   while the window is not visible
+#   None     while paused, e.g. during a download (pause / resume nest)
+IDLE_AFTER = 1.0
+
+class PollScheduler:
+
+    def __init__(self, fast=0.02, slow=0.5, hidden=2.0):
+        self.fast = fast
+        self.slow = slow
+        self.hidden = hidden
+        self.visible = True
+        self.paused = 0
+        self.lastActivity = time.perf_counter()
+        self.staticPolls = 0
+        self.polls = deque(maxlen=256) # perf_counter() of the last polls
+        self.lock = threading.Lock()
+
+    def activity(self): # user set outputs, poll fast again
+        self.lastActivity = time.perf_counter()
+        self.staticPolls = 0
+
+    def polled(self, changed):
+        now = time.perf_counter()
+        self.polls.append(now)
+        if changed:
+            self.activity()
+        elif now - self.lastActivity >= IDLE_AFTER: # backoff starts at fast once idle
+            self.staticPolls += 1
+
+    def setVisible(self, visible):
+        self.visible = visible
+
+    def pause(self):
+        with self.lock:
+            self.paused += 1
+
+    def resume(self):
+        with self.lock:
+            self.paused = max(0, self.paused - 1)
+            self.activity()
+
+    def interval(self): # seconds to the next poll, None while paused
+        if self.paused:
+            return None
+        if not self.visible:
+            return self.hidden
+        if time.perf_counter() - self.lastActivity < IDLE_AFTER:
+            return self.fast
+        return min(self.slow, self.fast * 2 ** min(self.staticPolls, 16))
+
+    def rate(self, window=1.0): # achieved polls per second
+        now = time.perf_counter()
+        recent = [t for t in self.polls if now - t < window]
+        return len(recent) / window
+
+
+# Polls the whole bus every interval seconds through the worker and hands each
+# Snapshot to the subscribers, called from the poller thread. From Qt connect a
+# signal's emit. Port outputs written with every poll are set by setOutputs.
+# interval is seconds or a PollScheduler.
+class BusPoller(threading.Thread):
+
+    def __init__(self, worker, slaves, interval=0.1):
+        super().__init__(daemon=True)
+        self.worker = worker
+        self.slaves = list(slaves)
+        self.interval = interval
+        self.scheduler = interval if isinstance(interval, PollScheduler) else None
+        self.wakeUp = threading.Event()
+        self.outputs = {}
+        self.subscribers = []
+        self.stopped = threading.Event()
+        self.start()
+
+    def subscribe(self, fn):
+        self.subscribers.append(fn)
+
+    def unsubscribe(self, fn):
+        self.subscribers.remove(fn)
+
+    def setOutputs(self, slv, port0tx, port1tx):
+        self.outputs = {**self.outputs, slv: (list(port0tx), list(port1tx))} # replaced, never changed in place
+        if self.scheduler:
+            self.scheduler.activity()
+        self.wakeUp.set()
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeUp.set()
+
+    def run(self):
+        last = None
+        while not self.stopped.is_set():
+            start = time.perf_counter()
+            interval = self.scheduler.interval() if self.scheduler else self.interval
+            if self.slaves and interval is not None:
+                snap = self.worker.call(pollBus, self.slaves, self.outputs, priority=u2b.PRIO_HIGH)
+                if self.scheduler:
+                    self.scheduler.polled(last is None or not np.array_equal(last, snap.ports))
+                last = snap.ports
+                for fn in list(self.subscribers):
+                    fn(snap)
+            self.wakeUp.wait(max(0, (interval or 0.1) - (time.perf_counter() - start)))
+            self.wakeUp.clear()
+
+
+# Port monitor
+#--------------
+# Turns the snapshots of a BusPoller into bit edges. Subscribers get one Edge
+# per changed bit, from the poller thread, within one poll interval:
+#
+#   monitor = PortMonitor(BusPoller(worker, slaves=[0, 1], interval=0.02))
+#   monitor.subscribe(print, slaves=[1], port=u2b.PORT_0, mask=0x0F)
+#
+# The first snapshot only sets the reference, it has no edges.
+BITS = np.arange(32, dtype=np.uint32)
+
+# (row, port, bit, rising) arrays of all bits which differ between two port arrays
+def portEdges(prev, ports):
+    changed = prev ^ ports
+    rows, port, bit = ((changed[:, :, None] >> BITS) & 1).nonzero()
+    rising = (ports[rows, port] >> bit.astype(np.uint32)) & 1
+    return rows, port, bit, rising.astype(bool)
+
+class PortMonitor:
+
+    def __init__(self, poller):
+        self.poller = poller
+        self.last = None # last Snapshot
+        self.subscribers = [] # (fn, slaves, port, mask)
+        self.lock = threading.Lock()
+        poller.subscribe(self.update)
+
+    # fn(edge) for edges of slaves (None: all), port (None: both) and bits in mask
+    def subscribe(self, fn, slaves=None, port=None, mask=0xFFFFFFFF):
+        with self.lock:
+            self.subscribers = self.subscribers + [(fn, slaves, port, mask)]
+
+    def unsubscribe(self, fn):
+        with self.lock:
+            self.subscribers = [sub for sub in self.subscribers if sub[0] != fn]
+
+    def ports(self, slv): # (port0, port1) of the last snapshot, None before the first
+        snap = self.last
+        rows = (snap.slaves == slv).nonzero()[0] if snap else []
+        return tuple(int(word) for word in snap.ports[rows[0]]) if len(rows) else None
+
+    def stop(self):
+        self.poller.unsubscribe(self.update)
+        self.poller.stop()
+
+    def update(self, snap):
+        prev, self.last = self.last, snap
+        if prev is None or not np.array_equal(prev.slaves, snap.slaves):
+            return
+        rows, port, bit, rising = portEdges(prev.ports, snap.ports)
+        if not len(rows):
+            return
+        slv = snap.slaves[rows]
+        bitMask = np.uint32(1) << bit.astype(np.uint32)
+        for fn, slaves, onPort, mask in self.subscribers:
+            sel = (bitMask & np.uint32(mask)) != 0
+            if slaves is not None:
+                sel &= np.isin(slv, slaves)
+            if onPort is not None:
+                sel &= port == onPort
+            for i in sel.nonzero()[0]:
+                fn(Edge(snap.time, int(slv[i]), int(port[i]), int(bit[i]), bool(rising[i])))
+
+
+# Port recorder
+#---------------
+# Reads port 0 and 1 of one slave back to back, one sample per USB round trip,
+# into a preallocated ring buffer of SAMPLE rows. Memory stays the same however
+# long it runs, a .npy file (optional) gets every sample.
+SAMPLE = np.dtype([('time', '<i8'), ('port0', '<u4'), ('port1', '<u4'), ('sumErr', '<u2')]) # time: perf_counter_ns()
+RECORD_JOB = 0.02 # max seconds one recorder job keeps the worker
+RECORD_BATCH = 64 # samples of the first recorder job
+NPY_HEADER = 256 # fixed .npy header size, rewritten with the sample count
+
+# Read only port frames of updatePorts, as many samples as fit in seconds
+def recordPorts(dev, slv, maxSamples, seconds=RECORD_JOB):
+    samples = np.empty(maxSamples, SAMPLE)
+    port0 = (0, 0, 0, u2b.PWR_ON + ((slv & 0x7) << 4) + u2b.PORT_0, 0, 0, 0, 0)
+    port1 = (0, 0, 0, u2b.PWR_ON + ((slv & 0x7) << 4) + u2b.PORT_1, 0, 0, 0, 0)
+    t = u2b.Transaction(dev)
+    deadline = time.perf_counter() + seconds
+    n = 0
+    while n < maxSamples and time.perf_counter() < deadline:
+        t.activateCS0()
+        t.cmdOut(port0)
+        t.cmdInOut(port1) # Port 0 read
+        t.cmdInOut(port1) # Port 1 read
+        t.resetCS()
+        rx = t.flush()
+        samples[n] = (time.perf_counter_ns(), int.from_bytes(rx[4:8], 'big'), int.from_bytes(rx[12:16], 'big'),
+                      rx[9] * 2**8 + rx[10])
+        n += 1
+    return samples[:n]
+
+def npyHeader(dtype, count):
+    header = repr({'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': (count,)})
+    header = header.ljust(NPY_HEADER - 11) + '\n'
+    return b'\x93NUMPY\x01\x00' + (NPY_HEADER - 10).to_bytes(2, 'little') + header.encode('latin1')
+
+# Records until stop(). With setTrigger() the samples around the first match of
+# a bit pattern are handed to onCapture(samples) once the post trigger samples
+# are in. samples() returns the ring buffer content, oldest first.
+class PortRecorder(threading.Thread):
+
+    def __init__(self, worker, slv, size=1_000_000, fileName=None):
+        super().__init__(daemon=True)
+        self.worker = worker
+        self.slv = slv
+        self.ring = np.zeros(size, SAMPLE)
+        self.count = 0 # samples recorded since start
+        self.lock = threading.Lock()
+        self.trigger = None
+        self.file = open(fileName, 'wb') if fileName else None
+        if self.file:
+            self.file.write(npyHeader(SAMPLE, 0))
+        self.stopped = threading.Event()
+        self.start()
+
+    # Trigger when (port1 << 32 | port0) & mask changes to value, keep pre
+    # samples before and post samples from the trigger on (pre + post <= size)
+    def setTrigger(self, mask, value, pre, post, onCapture):
+        with self.lock:
+            self.trigger = {'mask': mask, 'value': value, 'pre': pre, 'post': post, 'onCapture': onCapture,
+                            'at': None, 'last': None}
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def run(self):
+        lastHeader = time.perf_counter()
+        batch = RECORD_BATCH # samples per job, twice what the last job got
+        try:
+            while not self.stopped.is_set():
+                samples = self.worker.call(recordPorts, self.slv, batch, priority=u2b.PRIO_HIGH)
+                batch = min(len(self.ring), max(RECORD_BATCH, 2 * len(samples)))
+                self.add(samples)
+                if self.file and time.perf_counter() - lastHeader > 1:
+                    lastHeader = time.perf_counter()
+                    self.writeHeader()
+        finally:
+            if self.file:
+                self.writeHeader()
+                self.file.close()
+
+    def writeHeader(self): # sample count of the file, readable by np.load(mmap_mode='r') any time
+        self.file.flush()
+        with open(self.file.name, 'r+b') as f:
+            f.write(npyHeader(SAMPLE, self.count))
+
+    def add(self, samples):
+        with self.lock:
+            start = self.count % len(self.ring)
+            first = min(len(samples), len(self.ring) - start)
+            self.ring[start:start + first] = samples[:first]
+            self.ring[:len(samples) - first] = samples[first:]
+            self.count += len(samples)
+            if self.file:
+                self.file.write(samples.tobytes())
+            if self.trigger:
+                self.checkTrigger(samples)
+
+    def checkTrigger(self, samples):
+        trig = self.trigger
+        if trig['at'] is None:
+            bits = samples['port1'].astype(np.uint64) << np.uint64(32) | samples['port0']
+            match = (bits & np.uint64(trig['mask'])) == np.uint64(trig['value'])
+            before = np.concatenate(([trig['last'] if trig['last'] is not None else True], match[:-1]))
+            edges = np.flatnonzero(match & ~before) # changes to the pattern only
+            trig['last'] = match[-1]
+            if len(edges):
+                trig['at'] = self.count - len(samples) + int(edges[0])
+        if trig['at'] is not None and self.count >= trig['at'] + trig['post']:
+            self.trigger = None
+            capture = self.window(trig['at'] - trig['pre'], trig['at'] + trig['post'])
+            threading.Thread(target=trig['onCapture'], args=(capture,), daemon=True).start()
+
+    def window(self, begin, end): # samples begin..end-1 (sample numbers since start) still in the ring
+        begin = max(begin, self.count - len(self.ring), 0)
+        idx = np.arange(begin, end) % len(self.ring)
+        return self.ring[idx]
+
+    def samples(self):
+        with self.lock:
+            return self.window(0, self.count)
+
+
+if __name__ == '__main__':
+    import sys
+    import argparse
+    parser = argparse.ArgumentParser(description='record the ports of one BSAT slave')
+    parser.add_argument('fileName', nargs='?', help='.npy output')
+    parser.add_argument('--slave', type=int, default=0)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--edges', action='store_true', help='print the port edges of all slaves instead')
+    args = parser.parse_args()
+    worker = u2b.DeviceWorker(u2b.openFTDI())
+    if args.edges:
+        slaves = [i for i in range(8) if worker.call(u2b.scanBus) & 1 << i]
+        monitor = PortMonitor(BusPoller(worker, slaves, 0.02))
+        monitor.subscribe(lambda e: print(f'{e.time / 1e9:.3f} slave {e.slv} port {e.port} bit {e.bit:2} '
+                                          f'{"rising" if e.rising else "falling"}'))
+        time.sleep(args.seconds)
+        monitor.stop()
+        sys.exit()
+    if not args.fileName:
+        parser.error('fileName is needed for recording')
+    recorder = PortRecorder(worker, args.slave, size=1 << 16, fileName=args.fileName)
+    time.sleep(args.seconds)
+    recorder.stop()
+    print(f'{recorder.count} samples, {recorder.count / args.seconds:.0f} per second')
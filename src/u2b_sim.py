@@ -0,0 +1,495 @@
+#!/usr/bin/env python
+
+# Software stand-in for the ftd2xx module with a simulated USB2BSAT adapter.
+# It interprets the MPSSE commands used by u2b_base (0x80, 0x86, 0x11, 0x31,
+# 0x87) and models the USB2BSAT FPGA with its BSAT slaves, so the tools and
+# benchmarks run without hardware:
+#
+#   U2B_SIM=1 python usb2bsat.py
+#
+# u2b_base imports this module instead of ftd2xx when U2B_SIM is set.
+# U2B_SIM_ADAPTERS sets the number of adapters (default 1), U2B_SIM_LATENCY
+# the delay per USB transfer in seconds. With U2B_SIM_REALTIME=0 the SPI and
+# BSAT bus timing is only simulated, not waited for.
+#
+# FPGA model (8 byte frames on CS0, bytes 0..3 header, byte 3 control):
+#   PORT_0/1  bytes 4..7 return the port selected by the previous port frame,
+#             bytes 1..2 return sumErr (slv7(p1,p0) .. slv0(p1,p0))
+#   S_PORT    writes and RD_NEXT requests go through the S-Port fifo, which the
+#             BSAT bus drains at FIFO_RATE words/s. Read data comes back in
+#             bytes 6..7 of a later S_PORT frame, byte 5 bit 0 = data valid
+#   BUS_CTRL  byte 4 bit 3 scan done, byte 5 detected slaves, byte 7 bit 0
+#             S-Port fifo at least half full
+# The adapter's own registers are reached on CS1 with 3 byte frames
+# [addr, hb, lb], the data of the previous frame's address comes back in
+# bytes 1..2.
+
+import os
+import time
+from array import array
+from collections import deque
+
+LATENCY = float(os.environ.get('U2B_SIM_LATENCY', 0.0005)) # seconds per USB transfer
+LATENCY_TIMER = 0.016 # chip holds back short reads without Send Immediate
+REALTIME = os.environ.get('U2B_SIM_REALTIME', '1') != '0' # wait for the simulated SPI clock
+FIFO_SIZE = 4096 # S-Port fifo words
+FIFO_RATE = 100_000 # words/s drained to the BSAT bus
+SCAN_TIME = 0.05 # bus scan duration (s)
+ERASE_TIME = 0.5 # flash range erase (s)
+PROG_TIME = 0.1 # flash programming after download data end (s)
+REBOOT_TIME = 0.2 # slave not responding after reboot (s)
+SLAVES = 0xFF # bitmask of slaves on the simulated bus
+
+# FPGA addresses, see u2b_base
+PWR_ON = (1 << 7)
+WR = (1 << 3)
+PORT_0 = 0
+PORT_1 = 1
+S_PORT = 2
+BUS_CTRL = 3
+RD_NEXT = 1
+
+# BSAT_Memory_Map
+BSAT_UID0 = 2
+BSAT_UID1 = 3
+BSAT_MODE1 = 15
+BSAT_CTRL0 = 16
+BSAT_CTRL1 = 17
+WR_AD_Flash_LSB = 0x19
+WR_AD_Flash_MSB = 0x1A
+BSAT_WR_DL_ADDR = 27
+WR_AD_Flash_Data = 0x1C
+RD_AD_Flash_LSB = 0x1D
+RD_AD_Flash_MSB = 0x1E
+RD_AD_Flash_Data = 0x20
+BSAT_HID_STATUS = 60
+BSAT_HID_PORT_0 = 61
+BSAT_HID_PORT_1 = 62
+BSAT_PORT_STATUS = [68, 73]
+BSAT_ERR_PORT_0 = [69, 74]
+BSAT_ERR_PORT_1 = [70, 75]
+BSAT_BOARD_TYPE = 83
+BSAT_NODE_INFO = 99
+
+# Flash ranges and their base address in the configuration flash
+RANGE_AUX = 1
+RANGE_STD = 2
+RANGE_MFD = 7
+FLASH_BASE = {RANGE_AUX: 0x000000, RANGE_STD: 0x400000, RANGE_MFD: 0xFF0000}
+
+# CTRL0 high bytes which have to precede a request
+ERASE_SEQ = (0xFF, 0xDA, 0x91, 0x20, 0xC0, 0x87, 0xAA)
+UNLOCK_SEQ = (0x84, 0x8B, 0x36, 0x4A, 0xB6, 0x4D, 0x1B)
+REBOOT_SEQ = (0x91, 0x20, 0xC0, 0x87, 0xAA, 0xF1, 0x60)
+
+# MPSSE
+CMD_OUT = 0x11
+CMD_INOUT = 0x31
+SET_BITS_LOW = 0x80
+SET_CLK_DIV = 0x86
+SEND_IMMEDIATE = 0x87
+CS0_N = 0x10
+CS1_N = 0x08
+
+
+# One BSAT node: a slave on the bus or the adapter FPGA itself
+class Node:
+
+    def __init__(self, boardType, boardNmbr):
+        self.mem = array('H', [0] * 256)
+        text = boardType.encode().ljust(16, b'\0')[:16] + boardNmbr.encode().ljust(16, b'\0')[:16]
+        for i in range(16):
+            self.mem[BSAT_BOARD_TYPE + i] = text[i * 2] * 256 + text[i * 2 + 1]
+        self.mem[BSAT_NODE_INFO] = 0x0020 # standard sys, 2 ports
+        self.mem[BSAT_UID0] = 0x0101 # featureID 1
+        self.mem[BSAT_UID1] = 0x0100 # bugfixID 1
+        self.mem[BSAT_HID_STATUS] = 8
+        self.mem[BSAT_PORT_STATUS[0]] = 32
+        self.mem[BSAT_PORT_STATUS[1]] = 32
+        self.flash = {} # range: programmed bytes, everything behind is erased (0xFF)
+        self.ctrlHist = deque(maxlen=7) # CTRL0 high bytes for sequence check
+        self.mode1 = (1 << 2) # outputs disabled
+        self.eraseDoneAt = None
+        self.progDoneAt = None
+        self.bootAt = 0
+        self.dlRange = None
+        self.dlBuf = bytearray()
+        self.unlocked = False
+        self.outputs = [0, 0]
+        self.inputs = [None, None] # None: outputs are looped back
+        self.reboots = 0
+
+    def portIn(self, port):
+        return self.outputs[port] if self.inputs[port] is None else self.inputs[port]
+
+    def errBits(self, port):
+        return self.mem[BSAT_ERR_PORT_0[port]] | self.mem[BSAT_ERR_PORT_1[port]]
+
+    def flashAddr(self, addr):
+        for rng, base in FLASH_BASE.items():
+            if base <= addr < base + 0x400000:
+                return rng, addr - base
+        return None, 0
+
+    def readFlash(self, addr):
+        rng, offset = self.flashAddr(addr)
+        data = self.flash.get(rng, b'')[offset:offset + 2].ljust(2, b'\xFF')
+        return data[0] * 256 + data[1]
+
+    def programFlash(self, rng, offset, data): # NOR flash, bits can only be cleared
+        buf = self.flash.setdefault(rng, bytearray())
+        if len(buf) < offset + len(data):
+            buf.extend(b'\xFF' * (offset + len(data) - len(buf)))
+        old = bytes(buf[offset:offset + len(data)])
+        if old.count(0xFF) == len(old):
+            buf[offset:offset + len(data)] = data
+        else:
+            buf[offset:offset + len(data)] = (int.from_bytes(old, 'big') & int.from_bytes(data, 'big')).to_bytes(len(data), 'big')
+
+    def read(self, addr, now):
+        if addr == BSAT_MODE1:
+            if self.eraseDoneAt is not None and now >= self.eraseDoneAt:
+                self.mode1 |= (1 << 15)
+            if self.progDoneAt is not None and now >= self.progDoneAt:
+                self.mode1 |= (1 << 14)
+            return self.mode1
+        if addr == RD_AD_Flash_Data:
+            return self.readFlash(self.mem[RD_AD_Flash_MSB] * 65536 + self.mem[RD_AD_Flash_LSB])
+        return self.mem[addr]
+
+    def write(self, addr, data, now):
+        if addr == BSAT_WR_DL_ADDR:
+            self.dlBuf += bytes((data // 256, data % 256))
+        elif addr == BSAT_CTRL0:
+            self.ctrl0(data, now)
+        elif addr == BSAT_CTRL1:
+            if data == 0x000E: # ScanDone, outputs enabled
+                self.mode1 &= ~(1 << 2)
+            if (data & 1 << 14) and tuple(self.ctrlHist) == UNLOCK_SEQ:
+                self.unlocked = True
+            if data & 1 << 15:
+                self.unlocked = False
+        elif addr == WR_AD_Flash_Data:
+            if self.unlocked:
+                rng, offset = self.flashAddr(self.mem[WR_AD_Flash_MSB] * 65536 + self.mem[WR_AD_Flash_LSB])
+                self.programFlash(rng, offset, bytes((data // 256, data % 256)))
+        else:
+            self.mem[addr] = data
+
+    def ctrl0(self, data, now):
+        hb, lb = data // 256, data % 256
+        seq = tuple(self.ctrlHist)
+        rng = (lb >> 4) & 0x7
+        if lb & 1 << 0: # erase request
+            if seq in (ERASE_SEQ, UNLOCK_SEQ):
+                self.flash[rng] = bytearray()
+                self.dlRange = rng
+                self.dlBuf = bytearray()
+                self.mode1 &= ~((1 << 15) | (1 << 14))
+                self.eraseDoneAt = now + ERASE_TIME
+                self.progDoneAt = None
+        elif lb & 1 << 3: # download data end
+            if self.dlRange is not None:
+                self.programFlash(self.dlRange, 0, bytes(self.dlBuf))
+                self.dlBuf = bytearray()
+                self.progDoneAt = now + PROG_TIME
+        elif lb & 1 << 1: # reboot
+            if seq == REBOOT_SEQ:
+                self.mode1 = (1 << 2)
+                self.eraseDoneAt = self.progDoneAt = None
+                self.bootAt = now + REBOOT_TIME
+                self.reboots += 1
+        self.ctrlHist.append(hb)
+
+
+# The FPGA of one USB2BSAT adapter with its BSAT bus
+class Bsat:
+
+    def __init__(self, serNr):
+        self.slaves = [Node('BSAT-SIM', f'{serNr.decode()}-{i}') for i in range(8)]
+        self.adapter = Node('USB2BSAT-SIM', serNr.decode())
+        self.present = SLAVES
+        self.scanDoneAt = 0
+        self.scaned = 0
+        self.fifo = deque() # [slv, addr, data (big-endian words) or None for read, pos]
+        self.fifoWords = 0
+        self.overflows = 0 # words lost because the fifo was full
+        self.readFifo = deque()
+        self.drainedTo = 0.0 # time up to which the fifo has been drained
+        self.portLatch = 0
+        self.cs1Latch = 0
+
+    def node(self, slv, now):
+        if (self.present & 1 << slv) and now >= self.slaves[slv].bootAt:
+            return self.slaves[slv]
+        return None
+
+    def sumErr(self):
+        err = 0
+        for slv in range(8):
+            for port in range(2):
+                if self.slaves[slv].errBits(port):
+                    err |= 1 << (slv * 2 + port)
+        return err
+
+    def drain(self, now): # hand fifo words to the slaves up to now
+        n = int((now - self.drainedTo) * FIFO_RATE)
+        if n <= 0:
+            return
+        self.drainedTo += n / FIFO_RATE
+        if not self.fifo:
+            self.drainedTo = now
+            return
+        at = self.drainedTo - n / FIFO_RATE # time the next word reaches the bus
+        while n and self.fifo:
+            entry = self.fifo[0]
+            slv, addr, data, pos = entry
+            node = self.node(slv, at)
+            if data is None: # read request
+                k = 1
+                if node:
+                    self.readFifo.append(node.read(addr, at))
+            else:
+                k = min(n, len(data) // 2 - pos)
+                if node:
+                    if addr == BSAT_WR_DL_ADDR:
+                        node.dlBuf += data[pos * 2:(pos + k) * 2]
+                    else:
+                        for i in range(pos, pos + k):
+                            node.write(addr, data[i * 2] * 256 + data[i * 2 + 1], at)
+                entry[3] = pos + k
+            if data is None or entry[3] * 2 == len(data):
+                self.fifo.popleft()
+            n -= k
+            at += k / FIFO_RATE
+            self.fifoWords -= k
+
+    def push(self, slv, addr, data):
+        words = 1 if data is None else len(data) // 2
+        free = FIFO_SIZE - self.fifoWords
+        if words > free:
+            self.overflows += words - free
+            if data is None or free == 0:
+                return
+            data = data[:free * 2]
+            words = free
+        self.fifo.append([slv, addr, data, 0])
+        self.fifoWords += words
+
+    def frame(self, f, now): # one 8 byte frame on CS0, returns the response
+        ctrl = f[3]
+        slv = (ctrl >> 4) & 0x7
+        sel = ctrl & 0x3
+        self.drain(now)
+        rsp = bytearray(8)
+        if sel in (PORT_0, PORT_1):
+            err = self.sumErr()
+            rsp[1:3] = bytes((err // 256, err % 256))
+            rsp[4:8] = self.portLatch.to_bytes(4, 'big')
+            node = self.node(slv, now)
+            if node:
+                if ctrl & WR:
+                    node.outputs[sel] = int.from_bytes(f[4:8], 'big')
+                self.portLatch = node.portIn(sel)
+            else:
+                self.portLatch = 0
+        elif sel == S_PORT:
+            if self.readFifo:
+                word = self.readFifo.popleft()
+                rsp[5:8] = bytes((1, word // 256, word % 256))
+            if ctrl & WR:
+                self.push(slv, f[5], bytes(f[6:8]))
+            elif f[4] & RD_NEXT:
+                self.push(slv, f[5], None)
+        else: # BUS_CTRL
+            if ctrl & WR:
+                data = f[6] * 256 + f[7]
+                if data & 1 << 0: # rescan
+                    self.scanDoneAt = now + SCAN_TIME
+                    self.scaned = 0
+            if now >= self.scanDoneAt:
+                self.scaned = self.present
+            rsp[4] = (1 << 3) if now >= self.scanDoneAt else 0
+            rsp[5] = self.scaned
+            rsp[7] = 1 if self.fifoWords >= FIFO_SIZE // 2 else 0
+        return rsp
+
+    def frames(self, payload, now, frameTime): # many write-only frames, fast path for streamed S-Port writes
+        n = len(payload) // 8
+        ctrl = payload[3]
+        if (ctrl & 0x3) == S_PORT and (ctrl & WR) and payload[3::8] == bytes((ctrl,)) * n \
+                and payload[5::8] == bytes((payload[5],)) * n:
+            self.drain(now)
+            # same as n frame() calls if no read data can come up in between and the fifo has room
+            if n <= FIFO_SIZE - self.fifoWords and all(entry[2] is not None for entry in self.fifo):
+                for i in range(min(n, len(self.readFifo))): # every S-Port frame takes a word off the read fifo
+                    self.readFifo.popleft()
+                data = bytearray(n * 2)
+                data[0::2] = payload[6::8]
+                data[1::2] = payload[7::8]
+                self.push((ctrl >> 4) & 0x7, payload[5], bytes(data))
+                return now + n * frameTime
+        for i in range(0, n * 8, 8): # clocked like Device.clock, each frame ends frameTime later
+            now += frameTime
+            self.frame(payload[i:i + 8], now)
+        return now
+
+    def cs1Frame(self, f, now): # one 3 byte frame on CS1 to the adapter registers
+        addr = f[0]
+        rsp = bytes((0, self.cs1Latch // 256, self.cs1Latch % 256))
+        if addr in (BSAT_CTRL0, BSAT_CTRL1, BSAT_WR_DL_ADDR):
+            self.adapter.write(addr, f[1] * 256 + f[2], now)
+        self.cs1Latch = self.adapter.read(addr, now)
+        return rsp
+
+
+# Handle returned by open/openEx, the ftd2xx device object
+class Device:
+
+    def __init__(self, serNr):
+        self.serNr = serNr
+        self.bsat = adapters[serNr]
+        self.rxBuf = bytearray()
+        self.cs = 0x18
+        self.partial = bytearray() # started frame
+        self.partialIn = [] # positions of the started frame clocked by CMD_INOUT
+        self.immediate = False
+        self.byteTime = 8 / 10_000_000
+        self.now = time.perf_counter()
+        self.latencyTimer = LATENCY_TIMER
+        # transfer counters for benchmarks
+        self.writes = 0
+        self.reads = 0
+        self.bytesOut = 0
+        self.bytesIn = 0
+
+    def setTimeouts(self, read, write):
+        pass
+
+    def setLatencyTimer(self, msec):
+        self.latencyTimer = msec / 1000
+
+    def setBitMode(self, mask, mode):
+        pass
+
+    def close(self):
+        pass
+
+    def purge(self, mask=0):
+        self.rxBuf = bytearray()
+
+    def getStatus(self):
+        return (len(self.rxBuf), 0, 0)
+
+    def getDeviceInfo(self):
+        return {'type': 6, 'id': 0x04036010, 'serial': self.serNr, 'description': b'USB2BSAT SIM A'}
+
+    def getQueueStatus(self):
+        return len(self.rxBuf)
+
+    def write(self, data):
+        data = bytes(data)
+        self.writes += 1
+        self.bytesOut += len(data)
+        if LATENCY:
+            time.sleep(LATENCY)
+        self.now = max(self.now, time.perf_counter())
+        i = 0
+        while i < len(data):
+            cmd = data[i]
+            if cmd == SET_BITS_LOW:
+                if data[i + 1] != self.cs:
+                    self.endFrame()
+                self.cs = data[i + 1]
+                i += 3
+            elif cmd == SET_CLK_DIV:
+                div = data[i + 1] + data[i + 2] * 256
+                self.byteTime = 8 / (12_000_000 / ((div + 1) * 2))
+                i += 3
+            elif cmd == SEND_IMMEDIATE:
+                self.immediate = True
+                i += 1
+            elif cmd in (CMD_OUT, CMD_INOUT):
+                n = data[i + 1] + data[i + 2] * 256 + 1
+                self.clock(data[i + 3:i + 3 + n], cmd == CMD_INOUT)
+                if cmd == CMD_INOUT:
+                    self.immediate = False
+                i += 3 + n
+            else: # bad command, the MPSSE answers 0xFA and the opcode
+                self.rxBuf += bytes((0xFA, cmd))
+                i += 1
+        wait = self.now - time.perf_counter()
+        if REALTIME and wait > 0: # chip still clocking
+            time.sleep(wait)
+        return len(data)
+
+    def endFrame(self): # CS change, a started frame is dropped
+        self.rxBuf += b'\x00' * len(self.partialIn)
+        self.partial = bytearray()
+        self.partialIn = []
+
+    def clock(self, payload, inout):
+        if self.cs == CS0_N:
+            size = 8
+        elif self.cs == CS1_N:
+            size = 3
+        else: # no slave selected
+            if inout:
+                self.rxBuf += b'\xFF' * len(payload)
+            return
+        if not inout and not self.partial and size == 8 and len(payload) % 8 == 0:
+            self.now = self.bsat.frames(payload, self.now, self.byteTime * 8)
+            return
+        for byte in payload:
+            if inout:
+                self.partialIn.append(len(self.partial))
+            self.partial.append(byte)
+            if len(self.partial) == size:
+                self.now += self.byteTime * size
+                if size == 8:
+                    rsp = self.bsat.frame(self.partial, self.now)
+                else:
+                    rsp = self.bsat.cs1Frame(self.partial, self.now)
+                self.rxBuf += bytes(rsp[k] for k in self.partialIn)
+                self.partial = bytearray()
+                self.partialIn = []
+
+    def read(self, nbytes):
+        self.reads += 1
+        wait = LATENCY
+        if not self.immediate and len(self.rxBuf) < 510: # short packet waits for the latency timer
+            wait += self.latencyTimer
+        if wait:
+            time.sleep(wait)
+        data = bytes(self.rxBuf[:nbytes])
+        del self.rxBuf[:nbytes]
+        self.bytesIn += len(data)
+        return data
+
+
+# ftd2xx module interface
+#-------------------------
+adapters = {} # serial number: Bsat, the FPGA state survives close/open
+for i in range(int(os.environ.get('U2B_SIM_ADAPTERS', 1))):
+    adapters[f'SIM{i:05d}'.encode()] = Bsat(f'SIM{i:05d}'.encode())
+
+def createDeviceInfoList():
+    return len(adapters)
+
+def getDeviceInfoDetail(devnum=0, update=True):
+    serNr = list(adapters)[devnum]
+    return {'index': devnum, 'flags': 0, 'type': 6, 'id': 0x04036010, 'location': 0,
+            'serial': serNr, 'description': b'USB2BSAT SIM A', 'handle': None}
+
+def listDevices(flags=0):
+    return list(adapters)
+
+def openEx(serNr, flags=1):
+    if serNr == b'':
+        serNr = list(adapters)[0]
+    if serNr not in adapters:
+        raise Exception('DEVICE_NOT_FOUND')
+    return Device(serNr)
+
+def open(dev=0):
+    return Device(list(adapters)[dev])
@@ -2,13 +2,19 @@
 
 import sys
 import os
-import time
 import csv
+import threading
+from collections import OrderedDict
 import u2b_base as u2b
+import u2b_flash
+import u2b_ports
+import u2b_errors
+import u2b_mfd
 from PyQt5.QtWidgets import (QApplication, QWidget, QCheckBox, QPushButton, QRadioButton, QButtonGroup, QProgressBar,\
-                             QHBoxLayout, QVBoxLayout, QGridLayout, QGroupBox, QLabel, QFileDialog, QLineEdit, QTextEdit)
-from PyQt5.QtGui import (QIcon, QPixmap, QIntValidator)
-from PyQt5.QtCore import QTimer, pyqtSignal, Qt
+                             QHBoxLayout, QVBoxLayout, QGridLayout, QGroupBox, QLabel, QFileDialog, QLineEdit, QTableView,\
+                             QHeaderView)
+from PyQt5.QtGui import (QIcon, QPixmap, QIntValidator, QPainter, QColor, QFontDatabase)
+from PyQt5.QtCore import (QTimer, pyqtSignal, Qt, QRect, QSize, QEvent, QAbstractTableModel, QModelIndex)
 
 
 # Other Constants
@@ -37,8 +43,15 @@ BSAT_ERR_MASK_PORT_1_0 = 76
 BSAT_ERR_MASK_PORT_1_1 = 77
 BSAT_BOARD_TYPE = 83
 BSAT_NODE_INFO = 99
+BSAT_MASKS = [BSAT_HID_MASK_0, BSAT_HID_MASK_1, BSAT_NODE_ERR_MASK, BSAT_ERR_MASK_PORT_0_0,
+              BSAT_ERR_MASK_PORT_0_1, BSAT_ERR_MASK_PORT_1_0, BSAT_ERR_MASK_PORT_1_1]
+BSAT_STATIC = list(range(BSAT_BOARD_TYPE, BSAT_BOARD_TYPE + 16)) + [BSAT_NODE_INFO, BSAT_UID0, BSAT_UID1]
 
 S_USR_START = 0  # 0xB0
+SPORT_WORDS = 256 # 8 bit S-Port address
+MEM_COLUMNS = 8 # words per row of the memory view
+MEM_PAGE_ROWS = 4 # rows fetched with one block read
+MEM_MAX_PAGES = 16 # pages kept in the memory view cache
 # Flash Ranges
 RANGE_AUX = 1
 RANGE_STD = 2
@@ -46,33 +59,34 @@ RANGE_MFD = 7
 
 LARGE_FONT = ("Verdana", 12)
 
-# Open FTDI device as dev
-dev = u2b.openFTDI()
+# Open FTDI device, only the worker thread talks to it
+worker = u2b.DeviceWorker(u2b.openFTDI())
+# Slave registers which can't change until rescan, reboot or download
+regCache = u2b.RegisterCache(worker, static=BSAT_STATIC, writeThrough=BSAT_MASKS)
+# sumErr of every poll, history in U2B_ERR_HISTORY (.npz) if set
+errMonitor = u2b_errors.ErrorMonitor(worker, os.environ.get('U2B_ERR_HISTORY'))
 
 class HIDWindow(QWidget):
 
-    def __init__(self, dev, slv):
+    def __init__(self, regs, slv):
         super().__init__()
         self.setGeometry(400, 400, 400, 200)
         self.setWindowTitle('HIDs')
         self.setWindowIcon(QIcon(u2b.resource_path('besi.png')))
         self.GreenLedOn = QPixmap(u2b.resource_path('green-led-on.png')).scaledToWidth(20)
         self.LedOff = QPixmap(u2b.resource_path('led-off.png')).scaledToWidth(20)
-        self.createHIDBox(dev, slv)
+        self.createHIDBox(regs, slv)
 
         layout = QGridLayout()
         layout.addWidget(self.HIDBox, 0, 0, 1, 1)
         self.setLayout(layout)
 
-    def createHIDBox(self, dev, slv):
+    def createHIDBox(self, regs, slv):
         self.HIDBox = QGroupBox(f'HID Slave: {slv}')
         # get HID's from actual slave
-        u2b.activate_CS0_n(dev)
-        numOfHID = u2b.readSPort(dev, slv, BSAT_HID_STATUS) & 0x00FF
-        actHID0 = u2b.readSPort(dev, slv, BSAT_HID_PORT_0)
-        actHID1 = u2b.readSPort(dev, slv, BSAT_HID_PORT_1)
-        actHID = actHID0 + (actHID1 * 2 ** 16) # maximum of 32 HID's per Slave
-        u2b.reset_CSx_n(dev)
+        words = regs.readSPortList(slv, [BSAT_HID_STATUS, BSAT_HID_PORT_0, BSAT_HID_PORT_1])
+        numOfHID = words[0] & 0x00FF
+        actHID = words[1] + (words[2] * 2 ** 16) # maximum of 32 HID's per Slave
 
         layout = QGridLayout()
         layout.setAlignment(Qt.AlignCenter)
@@ -97,28 +111,25 @@ class HIDWindow(QWidget):
 
 class errorWindow(QWidget):
 
-    def __init__(self, dev, slv, port):
+    def __init__(self, regs, slv, port):
         super().__init__()
         self.setGeometry(300, 300, 400, 200)
         self.setWindowTitle('Port Errors')
         self.setWindowIcon(QIcon(u2b.resource_path('besi.png')))
         self.RedLedOn = QPixmap(u2b.resource_path('red-led-on.png')).scaledToWidth(20)
         self.LedOff = QPixmap(u2b.resource_path('led-off.png')).scaledToWidth(20)
-        self.createErrorBox(dev, slv, port)
+        self.createErrorBox(regs, slv, port)
 
         layout = QGridLayout()
         layout.addWidget(self.errorBox, 0, 0, 1, 1)
         self.setLayout(layout)
 
-    def createErrorBox(self, dev, slv, port):
+    def createErrorBox(self, regs, slv, port):
         self.errorBox = QGroupBox(f'Errors Port {port}')
         # get errors from actual port
-        u2b.activate_CS0_n(dev)
-        numOfErr = u2b.readSPort(dev, slv, BSAT_PORT_STATUS[port]) & 0x003F
-        actErr0 = u2b.readSPort(dev, slv, BSAT_ERR_PORT_0[port])
-        actErr1 = u2b.readSPort(dev, slv, BSAT_ERR_PORT_1[port])
-        actErr = actErr0 + (actErr1 * 2 ** 16) # maximum of 32 Errors per port
-        u2b.reset_CSx_n(dev)
+        words = regs.readSPortList(slv, [BSAT_PORT_STATUS[port], BSAT_ERR_PORT_0[port], BSAT_ERR_PORT_1[port]])
+        numOfErr = words[0] & 0x003F
+        actErr = words[1] + (words[2] * 2 ** 16) # maximum of 32 Errors per port
 
         layout = QGridLayout()
         layout.setAlignment(Qt.AlignCenter)
@@ -140,20 +151,26 @@ class errorWindow(QWidget):
             layout.addWidget(lblBit[i], 1, i)
         # Reset Button
         self.resetButton = QPushButton('Reset')
-        self.resetButton.clicked.connect(lambda: self.resetErr(dev, slv, port, numOfErr))
+        self.resetButton.clicked.connect(lambda: self.resetErr(regs, slv, port, numOfErr))
         layout.addWidget(self.resetButton, 0, numOfErr)
+        # error counters since start or reset
+        self.lblHistory = QLabel(errMonitor.portLine(slv, port))
+        self.lblHistory.setWordWrap(True)
+        layout.addWidget(self.lblHistory, 2, 0, 1, numOfErr + 1)
         self.errorBox.setLayout(layout)
 
-    def resetErr(self, dev, slv, port, numOfErr):
+    def resetErrJob(self, dev, slv, port):
         # write 0 to error ports
-        u2b.activate_CS0_n(dev)
-        u2b.writeSPort(dev, slv, BSAT_ERR_PORT_0[port], 0x000) 
+        u2b.writeSPort(dev, slv, BSAT_ERR_PORT_0[port], 0x000)
         u2b.writeSPort(dev, slv, BSAT_ERR_PORT_1[port], 0x000)
-        # re-read port errors 
-        actErr0 = u2b.readSPort(dev, slv, BSAT_ERR_PORT_0[port])
-        actErr1 = u2b.readSPort(dev, slv, BSAT_ERR_PORT_1[port])
-        actErr = actErr0 + (actErr1 * 2 ** 16) # maximum of 32 Errors per port
-        u2b.reset_CSx_n(dev)
+        # re-read port errors
+        return u2b.readSPortList(dev, slv, [BSAT_ERR_PORT_0[port], BSAT_ERR_PORT_1[port]])
+
+    def resetErr(self, regs, slv, port, numOfErr):
+        words = regs.worker.call(u2b.onCS0, self.resetErrJob, slv, port)
+        errMonitor.reset(slv, port)
+        self.lblHistory.setText(errMonitor.portLine(slv, port))
+        actErr = words[0] + (words[1] * 2 ** 16) # maximum of 32 Errors per port
         # update led status
         for i in range(numOfErr):
             # Rx line
@@ -163,7 +180,161 @@ class errorWindow(QWidget):
                 self.lblErr[i].setPixmap(self.LedOff)
 
 
+# One row of LEDs painted by a single widget, bit 0 is the rightmost cell.
+# setWord() repaints only the cells whose bit changed.
+class BitGrid(QWidget):
+
+    def __init__(self, bits, ledOn, ledOff):
+        super().__init__()
+        self.bits = bits
+        self.ledOn = ledOn
+        self.ledOff = ledOff
+        self.word = 0
+
+    def sizeHint(self):
+        return QSize(self.bits * (self.ledOff.width() + 6), self.ledOff.height() + 4)
+
+    def cellRect(self, bit):
+        cellWidth = self.width() / self.bits
+        return QRect(int((self.bits - 1 - bit) * cellWidth), 0, int(cellWidth) + 1, self.height())
+
+    def setWord(self, word):
+        changed = word ^ self.word
+        self.word = word
+        while changed:
+            bit = changed.bit_length() - 1
+            self.update(self.cellRect(bit))
+            changed &= ~(1 << bit)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        for bit in range(self.bits):
+            rect = self.cellRect(bit)
+            if rect.intersects(event.rect()):
+                led = self.ledOn if self.word & 1 << bit else self.ledOff
+                painter.drawPixmap(rect.center().x() - led.width() // 2, rect.center().y() - led.height() // 2, led)
+
+
+# S-Port memory as MEM_COLUMNS words per row. Pages of MEM_PAGE_ROWS rows are
+# read with one block read the first time the view asks for one of their cells,
+# so only what is on screen costs bus traffic. refresh() re-reads the pages
+# still shown and highlights the words which changed. Edits are queued as
+# writes to the worker.
+class SPortModel(QAbstractTableModel):
+    pageRead = pyqtSignal(object, int, object) # slv, page, words; emitted from the worker side
+
+    def __init__(self, words=SPORT_WORDS):
+        super().__init__()
+        self.words = words
+        self.slv = None
+        self.pages = OrderedDict() # page: array('H'), least recently used first
+        self.stale = set() # pages shown with old content until read again
+        self.loading = set() # (slv, page) of the reads queued
+        self.changed = set() # addresses changed by the last read of their page
+        self.changedColor = QColor('yellow')
+        self.pageRead.connect(self.pageLoaded)
+
+    def setSlave(self, slv): # None: nothing to show
+        self.beginResetModel()
+        self.slv = slv
+        self.pages.clear()
+        self.stale.clear()
+        self.changed.clear()
+        self.endResetModel()
+
+    def refresh(self):
+        self.stale = set(self.pages)
+        self.dataChanged.emit(self.index(0, 0), self.index(self.rowCount() - 1, MEM_COLUMNS - 1))
+
+    def rowCount(self, parent=QModelIndex()):
+        return -(-self.words // MEM_COLUMNS)
+
+    def columnCount(self, parent=QModelIndex()):
+        return MEM_COLUMNS
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return f'{section:X}'
+        return f'{section * MEM_COLUMNS:02X}'
+
+    def flags(self, index):
+        if index.row() * MEM_COLUMNS + index.column() >= self.words:
+            return Qt.NoItemFlags
+        return Qt.ItemIsSelectable | Qt.ItemIsEnabled | Qt.ItemIsEditable
+
+    def data(self, index, role=Qt.DisplayRole):
+        addr = index.row() * MEM_COLUMNS + index.column()
+        if self.slv is None or addr >= self.words:
+            return None
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            words = self.page(addr // (MEM_COLUMNS * MEM_PAGE_ROWS))
+            return '....' if words is None else f'{words[addr % (MEM_COLUMNS * MEM_PAGE_ROWS)]:04X}'
+        if role == Qt.BackgroundRole and addr in self.changed:
+            return self.changedColor
+        if role == Qt.ToolTipRole:
+            return f'address {addr} (0x{addr:02X})'
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        addr = index.row() * MEM_COLUMNS + index.column()
+        try:
+            word = int(value, 16)
+        except ValueError:
+            return False
+        if self.slv is None or not 0 <= word <= 0xFFFF:
+            return False
+        worker.submit(u2b.onCS0, u2b.writeSPort, self.slv, addr, word)
+        regCache.written(self.slv, [(addr, word)])
+        page = addr // (MEM_COLUMNS * MEM_PAGE_ROWS)
+        if page in self.pages:
+            self.pages[page][addr % (MEM_COLUMNS * MEM_PAGE_ROWS)] = word
+        self.dataChanged.emit(index, index)
+        return True
+
+    def page(self, page): # cached words of page, a read is queued if missing or stale
+        if (page not in self.pages or page in self.stale) and (self.slv, page) not in self.loading:
+            self.loading.add((self.slv, page))
+            addr = page * MEM_COLUMNS * MEM_PAGE_ROWS
+            slv = self.slv
+            future = worker.submit(u2b.onCS0, u2b.readSPortBlock, slv, addr, min(MEM_COLUMNS * MEM_PAGE_ROWS, self.words - addr))
+            future.add_done_callback(lambda f: self.pageRead.emit(slv, page, None if f.exception() else f.result()))
+        words = self.pages.get(page)
+        if words is not None:
+            self.pages.move_to_end(page)
+        return words
+
+    def pageLoaded(self, slv, page, words):
+        self.loading.discard((slv, page))
+        if slv != self.slv or words is None:
+            return
+        old = self.pages.get(page)
+        addr = page * MEM_COLUMNS * MEM_PAGE_ROWS
+        self.changed -= set(range(addr, addr + len(words)))
+        if old is not None:
+            self.changed |= {addr + i for i, (a, b) in enumerate(zip(old, words)) if a != b}
+        self.pages[page] = words
+        self.stale.discard(page)
+        while len(self.pages) > MEM_MAX_PAGES:
+            self.pages.popitem(last=False)
+        row = page * MEM_PAGE_ROWS
+        self.dataChanged.emit(self.index(row, 0), self.index(min(row + MEM_PAGE_ROWS, self.rowCount()) - 1, MEM_COLUMNS - 1))
+
+
 class Usb2Bsat(QWidget):
+    # results of worker jobs, emitted from the worker side
+    busRead = pyqtSignal(object)
+    portEdge = pyqtSignal(object)
+    scanDone = pyqtSignal(int)
+    dlProgress = pyqtSignal(int)
+    dlDone = pyqtSignal(int, bool) # slv, ok
+    dlRate = pyqtSignal(float)
+    dlSlaveProgress = pyqtSignal(int, int)
+    dlAllDone = pyqtSignal(object)
+    MFDWriteDone = pyqtSignal(bool)
+    MFDBatchDone = pyqtSignal(str, object)
+    MFDInventoryDone = pyqtSignal(str)
 
     def __init__(self):
         super().__init__()
@@ -187,19 +358,29 @@ class Usb2Bsat(QWidget):
 
         #some projektwide used variables
         self.slv = 0 # actual slave number
+        self.scaned = 0 # bitmask of detected slaves
         self.numOfPorts = 2
-        self.lblRx = [None] * 64  # create list. used to display Port LED's
+        self.portLeds = [None] * 2  # Port LED's, one BitGrid per port
+        self.portErr = [None, None] # error state shown on the error buttons
         self.btnTx = [None] * 64  
         self.errorButton = [None] * 2
         self.updateButton = [None] * 2
         self.port_tx = [[0, 0, 0, 0], [0, 0, 0, 0]] # 2 * (4*8bit) array to transmitt
-        self.MFDDataMap = ['Map ID', 'Board Number', 'Board Index', 'Board Name', 'Board ID', 'Supplier Lot', 'Supplier Name', \
-                           'Date of manufacture', 'Configuration', 'Test Location', 'FPGA Design Number', 'Test Date', 'Board History', 'Test ID']
+        self.MFDDataMap = u2b_mfd.MFD_FIELDS
         self.MFDValue = [None] * 14
         self.popUpWin = None
 
         self.bsatPwrCheckBox = QCheckBox('&BSAT Power    Slv: ')
         self.bsatPwrCheckBox.toggled.connect(self.changePower)
+        self.busPollCheckBox = QCheckBox('all slaves')
+        self.busPollCheckBox.setToolTip('poll the ports of all detected slaves')
+        self.busPollCheckBox.toggled.connect(self.startPolling)
+        self.busPoller = None
+        self.portMonitor = None # bit edges of the selected slave's ports
+        self.portsShown = None # slave whose port words are on the LEDs, edges are applied to them
+        self.pollScheduler = u2b_ports.PollScheduler() # poll rate follows the port activity
+        self.lblPollRate = QLabel('')
+        self.lblPollRate.setToolTip('port polls per second')
         self.slvRBtn = {}
         self.slvBtnGrp = QButtonGroup()
         for i in range(8):
@@ -217,9 +398,12 @@ class Usb2Bsat(QWidget):
             self.createPortGroupBox(i)
         self.createDownloadGroupBox()
         self.createMFDGroupBox()
+        self.createStatsGroupBox()
 
         self.topLayout = QHBoxLayout()
         self.topLayout.addWidget(self.bsatPwrCheckBox, )
+        self.topLayout.addWidget(self.busPollCheckBox)
+        self.topLayout.addWidget(self.lblPollRate)
  
         mainLayout = QGridLayout()
         mainLayout.addLayout(self.topLayout, 0, 0, 1, 3,)
@@ -229,11 +413,28 @@ class Usb2Bsat(QWidget):
         mainLayout.addWidget(self.portGroupBox[1], 3, 0, 1, 3)
         mainLayout.addWidget(self.downloadGroupBox, 4, 0, 1, 3)
         mainLayout.addWidget(self.MFDGroupBox, 5, 0, 1, 3)
+        mainLayout.addWidget(self.statsGroupBox, 6, 0, 1, 3)
         self.setLayout(mainLayout)
 
-        # setup timer to update BSAT Ports
-        self.updateTimer = QTimer()
-        self.updateTimer.timeout.connect(self.readWritePorts)
+        # BSAT Ports are polled by the BusPoller, its PortMonitor delivers the bit changes
+        self.busRead.connect(self.busPolled)
+        self.portEdge.connect(self.portEdgeGui)
+        self.emitEdge = self.portEdge.emit # one object, so it can be unsubscribed
+        self.scanDone.connect(self.scanFinished)
+        self.dlProgress.connect(self.rpdDlBar.setValue)
+        self.dlRate.connect(lambda rate: self.rpdLblRate.setText(f'{rate / 1000:.1f} kB/s'))
+        self.dlSlaveProgress.connect(lambda slv, percent: self.slvDlBar[slv].setValue(percent))
+        self.dlAllDone.connect(self.downloadAllFinished)
+        self.dlDone.connect(self.downloadFinished)
+        self.MFDWriteDone.connect(self.writeMFDFinished)
+        self.MFDBatchDone.connect(self.batchMFDFinished)
+        self.MFDInventoryDone.connect(self.exportMFDFinished)
+        # live USB statistics, only while enabled
+        self.statsTimer = QTimer()
+        self.statsTimer.timeout.connect(self.updateStats)
+        self.statsPrev = None
+        if u2b.stats: # enabled by U2B_STATS
+            self.statsCheckBox.setChecked(True)
 
 
 # ***************************************
@@ -276,19 +477,17 @@ class Usb2Bsat(QWidget):
         layout = QGridLayout()
         layout.setAlignment(Qt.AlignCenter)
         lblBit = {}
+        # Rx line
+        self.portLeds[port] = BitGrid(32, self.GreenLedOn, self.LedOff)
+        layout.addWidget(self.portLeds[port], 0, 0, 1, 32)  # bit 0 at grid pos 31
         for i in range(32):
-            # Rx line
-            self.lblRx[i + (port * 32)] = QLabel()
-            self.lblRx[i + (port * 32)].setPixmap(self.LedOff)
-            self.lblRx[i + (port * 32)].setAlignment(Qt.AlignCenter)
-            layout.addWidget(self.lblRx[i + (port * 32)], 0, 31-i)  # place lblRx[0] to grid pos 31 ..
             # Bit number
             lblBit[i] = QLabel(f'{31 - i}')
             lblBit[i].setAlignment(Qt.AlignCenter)
             layout.addWidget(lblBit[i], 1, i)
             # Tx line
             self.btnTx[i + (port * 32)] = QCheckBox()
-            layout.addWidget(self.btnTx[i + (port * 32)], 2, 31-i)  # place lblRx[0] to grid pos 31 .
+            layout.addWidget(self.btnTx[i + (port * 32)], 2, 31-i)  # place btnTx[0] to grid pos 31
         # Error Button
         self.errorButton[port] = QPushButton('Error')
         self.errorButton[port].clicked.connect(lambda: self.errorPort(port))
@@ -303,23 +502,23 @@ class Usb2Bsat(QWidget):
         self.userPortGroupBox = QGroupBox('User Port')
         layout = QGridLayout()
         self.startAddr = QLineEdit()
-        self.startAddr.setValidator(QIntValidator(0, 999))
-        self.numOfWords = QLineEdit()
-        self.numOfWords.setValidator(QIntValidator(1, 999))
-        self.sPortDisply = QTextEdit()
+        self.startAddr.setValidator(QIntValidator(0, SPORT_WORDS - 1))
+        self.startAddr.returnPressed.connect(self.gotoMem)
         lblStartAddr = QLabel('Start Address:')
-        lblNumOfWords = QLabel('Num of Words:')
-        sRead = QPushButton('read')
+        sRead = QPushButton('refresh')
+        sRead.setToolTip('read the shown words again, changes are highlighted')
         sRead.clicked.connect(self.readMem)
-        sWrite = QPushButton('write')
-        sWrite.clicked.connect(self.writeMem)
+        # words are read when shown, edited words are written
+        self.memModel = SPortModel()
+        self.memView = QTableView()
+        self.memView.setModel(self.memModel)
+        self.memView.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.memView.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.memView.verticalHeader().setDefaultSectionSize(self.memView.fontMetrics().height() + 4)
         layout.addWidget(lblStartAddr, 0, 0)
         layout.addWidget(self.startAddr, 0, 1, 1, 2)
-        layout.addWidget(lblNumOfWords, 0, 3)
-        layout.addWidget(self.numOfWords, 0, 4, 1, 2)
-        layout.addWidget(sRead, 1, 0)
-        layout.addWidget(sWrite, 1, 1)
-        layout.addWidget(self.sPortDisply, 2, 0, 3, 6)
+        layout.addWidget(sRead, 0, 3)
+        layout.addWidget(self.memView, 1, 0, 4, 6)
         self.userPortGroupBox.setLayout(layout)
 
     def createDownloadGroupBox(self):
@@ -344,12 +543,30 @@ class Usb2Bsat(QWidget):
         self.rpdStartButton.clicked.connect(lambda: self.downloadFirmware(self.sys))
         self.rpdDlBar = QProgressBar()
         self.rpdDlBar.setRange(0,100)
+        self.rpdLblRate = QLabel()
+        self.rpdDeltaCheckBox = QCheckBox('only changes')
+        self.rpdDeltaCheckBox.setToolTip('skip unchanged images, write appended blocks in place')
         layout.addWidget(self.stdSysRBtn, 0, 0)
         layout.addWidget(self.auxSysRBtn, 0, 1)
+        layout.addWidget(self.rpdDeltaCheckBox, 0, 2)
         layout.addWidget(self.rpdGetFileButton, 1, 0)
         layout.addWidget(self.rpdLblFileName, 1, 1)
         layout.addWidget(self.rpdStartButton, 2, 0)
         layout.addWidget(self.rpdDlBar, 2, 1)
+        layout.addWidget(self.rpdLblRate, 2, 2)
+        # all detected slaves at once
+        self.rpdStartAllButton = QPushButton("Start all")
+        self.rpdStartAllButton.clicked.connect(lambda: self.downloadFirmwareAll(self.sys))
+        layout.addWidget(self.rpdStartAllButton, 3, 0)
+        slvLayout = QHBoxLayout()
+        self.slvDlBar = [None] * 8
+        for i in range(8):
+            self.slvDlBar[i] = QProgressBar()
+            self.slvDlBar[i].setRange(0, 100)
+            self.slvDlBar[i].setFormat(f'{i}: %p%')
+            self.slvDlBar[i].hide()
+            slvLayout.addWidget(self.slvDlBar[i])
+        layout.addLayout(slvLayout, 3, 1, 1, 2)
         self.downloadGroupBox.setLayout(layout)
 
     def createMFDGroupBox(self):
@@ -363,6 +580,11 @@ class Usb2Bsat(QWidget):
         btnSafeFile.clicked.connect(self.safeMFDFile)
         btnLoadFile = QPushButton('load from File')
         btnLoadFile.clicked.connect(self.loadMFDFile)
+        self.btnMFDBatch = QPushButton('batch from File')
+        self.btnMFDBatch.setToolTip('program every slave with a row (board number or slave) in a .csv or SQLite table')
+        self.btnMFDBatch.clicked.connect(self.batchMFD)
+        self.btnInventory = QPushButton('export Inventory')
+        self.btnInventory.clicked.connect(self.exportMFDInventory)
         lblMFDName = {}
         for collumn in range(2):
             for row in range(7):
@@ -378,22 +600,40 @@ class Usb2Bsat(QWidget):
         layout.addWidget(self.btnMFDWrite, 1, 4)
         layout.addWidget(btnSafeFile, 3, 4)
         layout.addWidget(btnLoadFile, 4, 4)
+        layout.addWidget(self.btnMFDBatch, 5, 4)
+        layout.addWidget(self.btnInventory, 6, 4)
         self.MFDGroupBox.setLayout(layout)
 
+    def createStatsGroupBox(self):
+        self.statsGroupBox = QGroupBox('USB Statistics')
+        layout = QHBoxLayout()
+        self.statsCheckBox = QCheckBox('enable')
+        self.statsCheckBox.toggled.connect(self.enableStats)
+        self.valStats = QLabel()
+        self.valStats.setWordWrap(True)
+        layout.addWidget(self.statsCheckBox)
+        layout.addWidget(self.valStats, 1)
+        self.statsGroupBox.setLayout(layout)
+
 # ******** END creating LAYOUT ********
 # *************************************
 
     def changePower(self):
         if self.bsatPwrCheckBox.isChecked():
-            self.scanBsat()
-            self.updateTimer.start(100)
+            self.scanBsat() # port update starts when scan is done
         else:
-            self.updateTimer.stop()
-            u2b.activate_CS0_n(dev)
-            u2b.write_cmd_bytes(dev, 0x11, [0, 0, 0, 0, 0, 0, 0, 0])  # CMD_OUT all 0 
-            u2b.reset_CSx_n(dev)
+            self.stopPolling()
+            worker.call(self.powerOffJob)
+            regCache.invalidate()
             self.resetGui()
 
+    def powerOffJob(self, dev):
+        t = u2b.Transaction(dev)
+        t.activateCS0()
+        t.cmdOut([0, 0, 0, 0, 0, 0, 0, 0])  # CMD_OUT all 0
+        t.resetCS()
+        t.flush()
+
     def createSlaveButtons(self, scaned):
         checked = False
         # first, we delete all existing slave radio buttons
@@ -423,50 +663,77 @@ class Usb2Bsat(QWidget):
         rBtn = self.sender()
         if rBtn.isChecked():
             self.slv = int(rBtn.text())
+            if self.busPoller and not self.busPollCheckBox.isChecked():
+                self.startPolling() # single slave poller for the new slave
+            elif self.busPoller: # port outputs go to the selected slave, like in single slave polling
+                self.busPoller.setOutputs(self.slv, self.port_tx[0], self.port_tx[1])
+                self.portsShown = None
+                self.portMonitor.unsubscribe(self.emitEdge)
+                self.portMonitor.subscribe(self.emitEdge, slaves=[self.slv])
+            self.memModel.setSlave(self.slv)
             self.getSlaveInfo()
 
-    def scanBsat(self):
-        u2b.activate_CS0_n(dev)
-        u2b.busCtrl(dev, WR, 0x0002) # disable continous autoscan, reset rescan bit (0)
-        u2b.busCtrl(dev, WR, 0xF003) # max scandelay, initialize rescan
-        u2b.busCtrl(dev, WR, 0x0002) # disable continous autoscan, reset rescan bit (0)
-        rx = [0, 0, 0, 0, 0, 0, 0, 0]
-        timeout = 2 # seconds
-        timeout_start = time.time()
-        while time.time() < timeout_start + timeout:
-            rx = u2b.busCtrl(dev, RD, 0)
-            if (rx[4] & 1 << 3):  # scan done?
-                break
-        else: # scan timeout
-            print('scan timeout')
-        u2b.reset_CSx_n(dev)
-        self.createSlaveButtons(rx[5])
+    def scanBsat(self): # scan runs in the worker, scanFinished gets the result
+        future = worker.submit(u2b.scanBus, priority=u2b.PRIO_HIGH)
+        future.add_done_callback(self.scanned)
+
+    def scanned(self, future): # runs in the worker thread
+        if future.exception():
+            print(f'scan failed: {future.exception()}')
+        self.scanDone.emit(0 if future.exception() else future.result()) # no slaves after a failed scan
+
+    def scanFinished(self, scaned):
+        regCache.invalidate() # slaves may have been exchanged
+        self.scaned = scaned
+        self.createSlaveButtons(scaned)
+        self.startPolling()
+
+    def startPolling(self): # the selected slave or the whole bus by a BusPoller
+        self.stopPolling()
+        if not self.bsatPwrCheckBox.isChecked():
+            return
+        slaves = [i for i in range(8) if self.scaned & 1 << i]
+        if not self.busPollCheckBox.isChecked():
+            slaves = [slv for slv in slaves if slv == self.slv]
+        if slaves:
+            self.busPoller = u2b_ports.BusPoller(worker, slaves, self.pollScheduler)
+            self.busPoller.setOutputs(self.slv, self.port_tx[0], self.port_tx[1])
+            self.busPoller.subscribe(errMonitor.update)
+            self.busPoller.subscribe(self.busRead.emit)
+            self.portMonitor = u2b_ports.PortMonitor(self.busPoller)
+            self.portMonitor.subscribe(self.emitEdge, slaves=[self.slv])
+
+    def stopPolling(self):
+        self.lblPollRate.clear()
+        if self.portMonitor:
+            self.portMonitor.stop() # stops the poller as well
+        self.busPoller = None
+        self.portMonitor = None
+        self.portsShown = None
 
     def getSlaveInfo(self):
         brdType = ""
         brdNmbr = ""
         mem = []
-        u2b.activate_CS0_n(dev)
-        for i in range(16):  # read memory
-            word = u2b.readSPort(dev, self.slv, BSAT_BOARD_TYPE + i)
+        words = regCache.readSPortList(self.slv, BSAT_STATIC) # no bus traffic once read
+        for word in words[:16]:  # read memory
             hByte = word >> 8
             lByte = word & 0x00FF
             mem.append(hByte)
             mem.append(lByte)
-        nodeInfo = u2b.readSPort(dev, self.slv, BSAT_NODE_INFO)
+        nodeInfo = words[16]
         if (nodeInfo & 1 << 0):
             self.valSysInfo.setText('Auxiliary')
         else:
             self.valSysInfo.setText('Standard')
         self.numOfPorts = (nodeInfo & 0x00F0) // 16 # upper 4 bits
         self.valPorts.setText(f'{self.numOfPorts}')
-        uID_0 = u2b.readSPort(dev, self.slv, BSAT_UID0)
+        uID_0 = words[17]
         featureID = uID_0 & 0x00FF
         self.valFeature.setText(f'{featureID}')
-        uID_1 = u2b.readSPort(dev, self.slv, BSAT_UID1)
+        uID_1 = words[18]
         bugFix = uID_1 >> 8
         self.valBugfix.setText(f'{bugFix}')
-        u2b.reset_CSx_n(dev)
         for x in range(0, 16):  # convert to string Board Type
             if mem[x]:
                 brdType += chr(mem[x])
@@ -478,21 +745,23 @@ class Usb2Bsat(QWidget):
         self.enblSlave()
 
     def enblSlave(self):
+        masks = regCache.pending(self.slv, [(addr, 0xFFFF) for addr in BSAT_MASKS]) # S-Port Mask defaults
+        worker.call(self.enblSlaveJob, self.slv, masks)
+        regCache.written(self.slv, masks)
+
+    def enblSlaveJob(self, dev, slv, masks):
         u2b.activate_CS0_n(dev)
-        rx = u2b.readSPort(dev, self.slv, BSAT_MODE1)
+        rx = u2b.readSPort(dev, slv, BSAT_MODE1)
+        t = u2b.Transaction(dev)
         if (rx & 1 << 2): #outputs are disabled
-            u2b.writeSPort(dev, self.slv, BSAT_CTRL1, 0x0000) # set all bits 0 on S-Port address 0x11
-            u2b.writeSPort(dev, self.slv, BSAT_CTRL1, 0x0008)  # NodeEnable
-            u2b.writeSPort(dev, self.slv, BSAT_CTRL1, 0x000C)  # IdSuccessful
-            u2b.writeSPort(dev, self.slv, BSAT_CTRL1, 0x000E)  # ScanDone
-        u2b.writeSPort(dev, self.slv, BSAT_HID_MASK_0, 0xFFFF) # start writing S-Port Mask defaults
-        u2b.writeSPort(dev, self.slv, BSAT_HID_MASK_1, 0xFFFF)
-        u2b.writeSPort(dev, self.slv, BSAT_NODE_ERR_MASK, 0xFFFF)
-        u2b.writeSPort(dev, self.slv, BSAT_ERR_MASK_PORT_0_0, 0xFFFF)
-        u2b.writeSPort(dev, self.slv, BSAT_ERR_MASK_PORT_0_1, 0xFFFF)
-        u2b.writeSPort(dev, self.slv, BSAT_ERR_MASK_PORT_1_0, 0xFFFF)
-        u2b.writeSPort(dev, self.slv, BSAT_ERR_MASK_PORT_1_1, 0xFFFF) # end writing S-Port Mask defaults
-        u2b.reset_CSx_n(dev)
+            t.writeSPort(slv, BSAT_CTRL1, 0x0000) # set all bits 0 on S-Port address 0x11
+            t.writeSPort(slv, BSAT_CTRL1, 0x0008)  # NodeEnable
+            t.writeSPort(slv, BSAT_CTRL1, 0x000C)  # IdSuccessful
+            t.writeSPort(slv, BSAT_CTRL1, 0x000E)  # ScanDone
+        for addr, data in masks: # S-Port Masks not yet set
+            t.writeSPort(slv, addr, data)
+        t.resetCS()
+        t.flush()
 
     def setSys(self):
         rBtn = self.sender()
@@ -517,14 +786,31 @@ class Usb2Bsat(QWidget):
         self.valPorts.clear()
         for i in range(14): # clear all TextBoxes
             self.MFDValue[i].clear()
-        self.updatePortGui([(0, 0, 0, 0),(0, 0, 0, 0)], 0)
+        self.memModel.setSlave(None)
+        self.updatePortGui([0, 0], 0)
+
+    def enableStats(self, on):
+        if on:
+            if not u2b.stats:
+                u2b.enableStats()
+            self.statsPrev = u2b.stats.snapshot()
+            self.statsTimer.start(1000)
+        else:
+            self.statsTimer.stop()
+            u2b.enableStats(False)
+            self.valStats.clear()
+
+    def updateStats(self): # rates of the last second
+        snap = u2b.stats.snapshot()
+        self.valStats.setText(u2b.statsLine(u2b.statsRates(snap, self.statsPrev)).replace(' | ', '\n'))
+        self.statsPrev = snap
 
     def errorPort(self, port): # calls the error window
-        self.popErrWin = errorWindow(dev, self.slv, port)
+        self.popErrWin = errorWindow(regCache, self.slv, port)
         self.popErrWin.show()
 
     def HIDPort(self, port): # calls the HID window
-        self.popHIDWin = HIDWindow(dev, self.slv)
+        self.popHIDWin = HIDWindow(regCache, self.slv)
         self.popHIDWin.show()
 
     def updatePortTx(self, port): # sets the flag that the corresponding port must be written
@@ -533,91 +819,56 @@ class Usb2Bsat(QWidget):
             for j in range(8): # bites
                 if self.btnTx[j + (i * 8) + (port * 32)].isChecked():
                     self.port_tx[port][i] += (2 ** j)
+        self.pollScheduler.activity()
+        if self.busPoller: # written with the next poll, which comes right away
+            self.busPoller.setOutputs(self.slv, self.port_tx[0], self.port_tx[1])
+
+    def changeEvent(self, event): # slow polling while minimized
+        if event.type() == QEvent.WindowStateChange:
+            self.pollScheduler.setVisible(not self.isMinimized())
+        super().changeEvent(event)
+
+    def busPolled(self, snap): # error state of the selected slave, its port words once as the edges' reference
+        rows = (snap.slaves == self.slv).nonzero()[0]
+        if len(rows) and self.portsShown != self.slv:
+            self.updatePortGui(snap.ports[rows[0]], snap.sumErr)
+            self.portsShown = self.slv
+        elif len(rows):
+            self.updatePortErr(snap.sumErr)
+        self.showPollRate()
+
+    def portEdgeGui(self, edge): # u2b_ports.Edge of the selected slave
+        if edge.slv == self.slv and self.portsShown == self.slv:
+            word = self.portLeds[edge.port].word
+            self.portLeds[edge.port].setWord(word | 1 << edge.bit if edge.rising else word & ~(1 << edge.bit))
+
+    def showPollRate(self):
+        self.lblPollRate.setText(f'{self.pollScheduler.rate():.0f}/s')
+
+    def updatePortGui(self, ports, sumErr): # port words, only changes are drawn
+        self.updatePortErr(sumErr)
+        for i in range(self.numOfPorts):
+            self.portLeds[i].setWord(int(ports[i]))
 
-    def readWritePorts(self):
-        port_rec = u2b.updatePorts(dev, self.slv, self.port_tx[0], self.port_tx[1])
-        self.updatePortGui(port_rec[0], port_rec[1])
-
-    def updatePortGui(self, rx0_1, sumErr):
+    def updatePortErr(self, sumErr):
         for i in range(self.numOfPorts):
-            if (sumErr & 1 << (self.slv * 2 + i)): #sumErr on actSlv actPort
-                self.errorButton[i].setStyleSheet(self.RedLabel)
-            else:
-                self.errorButton[i].setStyleSheet(self.OrgLabel)
-            for j in range(4): # byte wise
-                for k in range(8):
-                    if (rx0_1[i][3 - j] & 1 << k):  # starting with bit 0, port 0
-                        self.lblRx[i*32 + j*8 + k].setPixmap(self.GreenLedOn)
-                    else:
-                        self.lblRx[i*32 + j*8 + k].setPixmap(self.LedOff)
+            err = bool(sumErr & 1 << (self.slv * 2 + i)) #sumErr on actSlv actPort
+            if err != self.portErr[i]:
+                self.portErr[i] = err
+                self.errorButton[i].setStyleSheet(self.RedLabel if err else self.OrgLabel)
     
-    def readMem(self): # read and displays the sPort memory
-        if (self.startAddr.text()):
-            if (self.numOfWords.text()):
-                u2b.activate_CS0_n(dev)
-                mem = ""
-                for i in range(int(self.numOfWords.text())):
-                    rx = u2b.readSPort(dev, self.slv, int(self.startAddr.text()) + i)
-                    word = f"{(rx):0{4}X} "  # convert to '01C3 '
-                    mem += word  # add to string
-                self.sPortDisply.setText(mem)
-                u2b.reset_CSx_n(dev)
-            else:
-                self.sPortDisply.setText('enter number of words')
-        else:
-            self.sPortDisply.setText('enter start Address')
+    def readMem(self): # re-read the sPort memory on screen
+        self.memModel.refresh()
 
-    def writeMem(self):
+    def gotoMem(self):
         if (self.startAddr.text()):
-            if (self.sPortDisply.toPlainText()):
-                mem = self.sPortDisply.toPlainText().split()
-                u2b.activate_CS0_n(dev)
-                for i in range(len(mem)):
-                    word_int = int(mem[i], 16)
-                    u2b.writeSPort(dev, self.slv, int(self.startAddr.text()) + i, word_int)
-                u2b.reset_CSx_n(dev)
-            else:
-                self.sPortDisply.setText('enter values to write')
-        else:
-            self.sPortDisply.setText('enter start Address')
+            row = int(self.startAddr.text()) // MEM_COLUMNS
+            self.memView.scrollTo(self.memModel.index(row, 0), QTableView.PositionAtTop)
 
     def readManufacturingData(self):
-        # S-Port Addresses
-        RD_AD_Flash_LSB = 0x1D
-        RD_AD_Flash_MSB = 0x1E
-        RD_AD_Flash_Data = 0x20
-        # Flash Addresses
-        MFD_Start_AD_MSB = 0x00FF
-        MFD_Start_AD_LSB = 0x0000
-        MFD_MAX_RANGE = 512
-        mem = []
-        u2b.activate_CS0_n(dev)
-        for i in range(0, MFD_MAX_RANGE, 2): # read only every second address
-            actual_AD_LSB = MFD_Start_AD_LSB + i
-            u2b.writeSPort(dev, self.slv, RD_AD_Flash_LSB, actual_AD_LSB)
-            u2b.writeSPort(dev, self.slv, RD_AD_Flash_MSB, MFD_Start_AD_MSB)
-            word = u2b.readSPort(dev, self.slv, RD_AD_Flash_Data)
-            if (word == 0xFFFF): # all read
-                break
-            hByte = word >> 8
-            lByte = word & 0x00FF
-            mem.append(hByte)
-            mem.append(lByte)
-        u2b.reset_CSx_n(dev)
-        for i in range(14): # clear all TextBoxes
-            self.MFDValue[i].clear()
-        actVal = 0
-        actStr = ''
-        for value in mem: # write Manufacturing data to GUI
-            if (value == 13): # CR
-                if (actVal < 14): # we only have 14 text lines
-                    self.MFDValue[actVal].setText(actStr) # write actual string
-                actVal += 1
-                actStr = ''
-            elif (32 <= value <= 126): # only ascii chars allowed
-                actStr += chr(value)
-            elif (value <= 9): # MAP_ID is stored as number
-                actStr += str(value)
+        mem = worker.call(u2b.onCS0, u2b_flash.readMFD, self.slv) # bytes up to the first erased word
+        for i, text in enumerate(u2b_mfd.decodeMFD(mem)): # write Manufacturing data to GUI
+            self.MFDValue[i].setText(text)
 
     def eraseManufacturingData(self):
         self.MFDEraseBtn.setStyleSheet(self.OrgLabel)
@@ -627,60 +878,75 @@ class Usb2Bsat(QWidget):
             self.MFDEraseBtn.setStyleSheet(self.RedLabel)
 
     def writeManufacturingData(self):
-        # S-Port Addresses
-        WR_AD_Flash_LSB = 0x19
-        WR_AD_Flash_MSB = 0x1A
-        WR_AD_Flash_Data = 0x1C
-        # Flash Addresses
-        MFD_Start_AD_MSB = 0x00FF
-        MFD_Start_AD_LSB = 0x0000
-        MFD_MAX_RANGE = 512
-        ListToWrite = [1, 0, 13] # special case MANU_MAP_ID
-        for i in range(1, 14): # read the rest 
-            for char in self.MFDValue[i].text():
-                if char.isascii():
-                    ListToWrite.append(ord(char))
-            ListToWrite.append(13) # append CR after each word
-        if (len(ListToWrite) % 2): # lenght is odd, we have to appent a 0
-            ListToWrite.append(0)
-        u2b.activate_CS0_n(dev)
-        # Flash erease
-        u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0x8400 + (RANGE_MFD << 4))  # erase Sequence 1
-        u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0x8B00 + (RANGE_MFD << 4))  # erase Sequence 2
-        u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0x3600 + (RANGE_MFD << 4))  # erase Sequence 3
-        u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0x4A00 + (RANGE_MFD << 4))  # erase Sequence 4
-        u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0xB600 + (RANGE_MFD << 4))  # erase Sequence 5
-        u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0x4D00 + (RANGE_MFD << 4))  # erase Sequence 6
-        u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0x1B00 + (RANGE_MFD << 4))  # erase Sequence 7
-        u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0x0000 + (RANGE_MFD << 4) + (1 << 0))  # erase Request
-        timeout = 5 # seconds
-        timeout_start = time.time()
-        while time.time() < timeout_start + timeout:
-            nMode_1 = u2b.readSPort(dev, self.slv, BSAT_MODE1)
-            if (nMode_1 & 1 << 15): # erase done?
-                break
-        else: # erase timeout
+        try:
+            data = u2b_mfd.encodeMFD([self.MFDValue[i].text() for i in range(1, 14)])
+        except ValueError as e:
+            print(e)
             self.btnMFDWrite.setStyleSheet(self.RedLabel)
-            u2b.reset_CSx_n(dev)
             return
-        u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0x8400)  # Unlock Sequence 1
-        u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0x8B00)  # Unlock Sequence 2
-        u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0x3600)  # Unlock Sequence 3
-        u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0x4A00)  # Unlock Sequence 4
-        u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0xB600)  # Unlock Sequence 5
-        u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0x4D00)  # Unlock Sequence 6
-        u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0x1B00)  # Unlock Sequence 7
-        u2b.writeSPort(dev, self.slv, BSAT_CTRL1, 1 << 14)  # Unlock Request
-        for i in range(0, len(ListToWrite), 2):
-            if (i > MFD_MAX_RANGE):
-                print('range error')
-                break
-            actual_AD_LSB = MFD_Start_AD_LSB + i
-            u2b.writeSPort(dev, self.slv, WR_AD_Flash_LSB, actual_AD_LSB)
-            u2b.writeSPort(dev, self.slv, WR_AD_Flash_MSB, MFD_Start_AD_MSB)
-            u2b.writeSPort(dev, self.slv, WR_AD_Flash_Data, ListToWrite[i] * (2**8) + ListToWrite[i + 1])
-        u2b.writeSPort(dev, self.slv, BSAT_CTRL1, 1 << 15)  # lock Request
-        u2b.reset_CSx_n(dev)
+        self.btnMFDWrite.setEnabled(False)
+        threading.Thread(target=self.writeMFDThread, args=(self.slv, data), daemon=True).start()
+
+    def writeMFDThread(self, slv, data): # erase wait, write and readback off the GUI thread
+        self.MFDWriteDone.emit(u2b_mfd.programMFD(worker, {slv: data})[slv])
+
+    def writeMFDFinished(self, ok):
+        self.btnMFDWrite.setEnabled(True)
+        self.btnMFDWrite.setStyleSheet(self.OrgLabel if ok else self.RedLabel)
+
+    def batchMFD(self): # all slaves of this adapter with a row in the table
+        filename = QFileDialog.getOpenFileName(self, "Select File", "", "*.csv *.db *.sqlite")
+        if (filename[0]):
+            self.btnMFDBatch.setEnabled(False)
+            self.pollScheduler.pause()
+            threading.Thread(target=self.batchMFDThread, args=(filename[0],), daemon=True).start()
+
+    def batchMFDThread(self, fileName):
+        results = {}
+        try:
+            rows = u2b_mfd.loadTable(fileName)
+            results = u2b_mfd.programBus(worker, rows, worker.call(u2b_flash.adapterSerial), scaned=self.scaned)
+            failed = [slv for slv, (boardNmbr, ok, row) in results.items() if not ok]
+            unmatched = [u2b_mfd.rowText(row) for row in u2b_mfd.unmatchedRows(rows, [row for b, ok, row in results.values()])]
+            result = (f'{len(results) - len(failed)} of {len(results)} boards programmed'
+                      + (f', failed: slaves {failed}' if failed else '')
+                      + (f', no slave for rows: {", ".join(unmatched)}' if unmatched else ''))
+        except Exception as e: # file, table or USB error
+            result = f'batch failed: {e}'
+        finally:
+            self.MFDBatchDone.emit(result, list(results))
+
+    def batchMFDFinished(self, result, slaves):
+        self.pollScheduler.resume()
+        self.btnMFDBatch.setEnabled(True)
+        self.btnMFDBatch.setToolTip(result)
+        print(result)
+        for slv in slaves: # MFD and identity may have changed
+            regCache.invalidate(slv)
+        self.getSlaveInfo()
+        if self.slv in slaves:
+            self.readManufacturingData()
+
+    def exportMFDInventory(self): # reads the MFD of all slaves off the GUI thread
+        filename = QFileDialog.getSaveFileName(self, "Select File", "", "*.csv *.db")
+        if (filename[0]):
+            self.btnInventory.setEnabled(False)
+            threading.Thread(target=self.exportMFDThread, args=(filename[0],), daemon=True).start()
+
+    def exportMFDThread(self, fileName):
+        try:
+            inventory = u2b_mfd.readInventory(worker, worker.call(u2b_flash.adapterSerial), scaned=self.scaned)
+            u2b_mfd.exportInventory(inventory, fileName)
+            result = f'{len(inventory)} boards -> {fileName}'
+        except Exception as e:
+            result = f'export failed: {e}'
+        finally:
+            self.MFDInventoryDone.emit(result)
+
+    def exportMFDFinished(self, result):
+        self.btnInventory.setEnabled(True)
+        self.btnInventory.setToolTip(result)
+        print(result)
 
     def safeMFDFile(self):
         filename = QFileDialog.getSaveFileName(self, "Select File", "", "*.csv")
@@ -706,78 +972,70 @@ class Usb2Bsat(QWidget):
     def downloadFirmware(self, sys):
         self.rpdStartButton.setStyleSheet(self.OrgLabel)
         if (self.rpdFileName[0]):
-            self.updateTimer.stop() # no port read during FW download
-            # ****** Erase Section ******
-            u2b.activate_CS0_n(dev)
-            u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0xFF00 + (sys << 4))  # Erase Sequence 1
-            u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0xDA00 + (sys << 4))  # Erase Sequence 2
-            u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0x9100 + (sys << 4))  # Erase Sequence 3
-            u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0x2000 + (sys << 4))  # Erase Sequence 4
-            u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0xC000 + (sys << 4))  # Erase Sequence 5
-            u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0x8700 + (sys << 4))  # Erase Sequence 6
-            u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0xAA00 + (sys << 4))  # Erase Sequence 7
-            u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0x0000 + (sys << 4) + (1 << 0))  # Erase Request
-            timeout = 5 # seconds
-            timeout_start = time.time()
-            while time.time() < timeout_start + timeout:
-                nMode_1 = u2b.readSPort(dev, self.slv, BSAT_MODE1)
-                if (nMode_1 & 1 << 15): # erase done?
-                    break
-            else: # erase timeout
-                self.rpdStartButton.setStyleSheet(self.RedLabel)
-                self.updateTimer.start(100)
-                u2b.reset_CSx_n(dev)
-                return
-            # ****** Download Section ******
-            rpdDlBarAct = 0
-            rpdDlBarMax = (os.stat(self.rpdFileName[0]).st_size) # get download file size in bytes
-            with open(self.rpdFileName[0], 'rb') as in_file:
-                while True:
-                    busCtrl = u2b.busCtrl(dev, RD, 0) #check if SPort fifo is less than half full
-                    fifoHalf = busCtrl[7] & 0x01
-                    if (not fifoHalf):
-                        for i in range(2000): # we have at least 2k free fifo
-                            self.rpdDlBar.setValue(int(100 / rpdDlBarMax * rpdDlBarAct))
-                            rpdDlBarAct += 2 # we write 2 bytes at a time
-                            byte = in_file.read(2)
-                            if len(byte) == 0: # all written
-                                break
-                            u2b.writeSPort(dev, self.slv, BSAT_WR_DL_ADDR, byte[0] * (2**8 ) + byte[1])  # Firmware Download
-                        if len(byte) == 0: # all written
-                            break
-            u2b.writeSPort(dev, self.slv, BSAT_CTRL0, (sys << 4) + (1 << 3))  # Download Data End
-            timeout = 5 # seconds
-            timeout_start = time.time()
-            while time.time() < timeout_start + timeout:
-                nMode_1 = u2b.readSPort(dev, self.slv, BSAT_MODE1)
-                if (nMode_1 & 1 << 14): # download done?
-                    break
-            else: # prog timeout
-                self.rpdStartButton.setStyleSheet(self.RedLabel)
-                u2b.reset_CSx_n(dev)
-                self.updateTimer.start(100)
-                return
-            # ****** Reboot Section ******
-            u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0x9100)  # Reboot Sequence 1
-            u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0x2000)  # Reboot Sequence 2
-            u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0xC000)  # Reboot Sequence 3
-            u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0x8700)  # Reboot Sequence 4
-            u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0xAA00)  # Reboot Sequence 5
-            u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0xF100)  # Reboot Sequence 6
-            u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0x6000)  # Reboot Sequence 7
-            u2b.writeSPort(dev, self.slv, BSAT_CTRL0, 0x6000 + (1 << 1))  # Reboot !
-            u2b.reset_CSx_n(dev)
-            time.sleep(1) # wait for reboot
-            self.rpdStartButton.setStyleSheet(self.GreenLabel)
-            self.getSlaveInfo() # update slave information
-            self.enblSlave()
-            self.updateTimer.start(100)
+            self.rpdStartButton.setEnabled(False)
+            self.pollScheduler.pause() # the link belongs to the download
+            threading.Thread(target=self.downloadThread, args=(self.slv, sys, self.rpdFileName[0]), daemon=True).start()
         else:
             self.rpdLblFileName.setText("select rpd File first !")
 
+    def downloadThread(self, slv, sys, fileName): # port polling is paused until downloadFinished
+        flash = u2b_flash.updateFirmware if self.rpdDeltaCheckBox.isChecked() else u2b_flash.flashFirmware
+        ok = False
+        try:
+            ok = flash(worker, slv, sys, fileName, self.dlProgress.emit, self.dlRate.emit)
+        except Exception as e: # USB error, file gone, ...
+            print(f'download failed: {e}')
+        finally:
+            self.dlDone.emit(slv, ok) # re-enables start and polling
+
+    def downloadFirmwareAll(self, sys):
+        slaves = [i for i in range(8) if self.scaned & 1 << i]
+        if not (self.rpdFileName[0]):
+            self.rpdLblFileName.setText("select rpd File first !")
+        elif slaves:
+            self.rpdStartButton.setEnabled(False)
+            self.rpdStartAllButton.setEnabled(False)
+            for i in range(8):
+                self.slvDlBar[i].setValue(0)
+                self.slvDlBar[i].setFormat(f'{i}: %p%')
+                self.slvDlBar[i].setStyleSheet('')
+                self.slvDlBar[i].setVisible(i in slaves)
+            self.pollScheduler.pause()
+            threading.Thread(target=self.downloadAllThread, args=(slaves, sys, self.rpdFileName[0]), daemon=True).start()
+
+    def downloadAllThread(self, slaves, sys, fileName):
+        results = dict.fromkeys(slaves, False)
+        try:
+            results = u2b_flash.flashFirmwareAll(worker, slaves, sys, fileName, self.dlSlaveProgress.emit)
+        except Exception as e:
+            print(f'download failed: {e}')
+        finally:
+            self.dlAllDone.emit(results)
+
+    def downloadAllFinished(self, results):
+        self.pollScheduler.resume()
+        self.rpdStartButton.setEnabled(True)
+        self.rpdStartAllButton.setEnabled(True)
+        for slv, ok in results.items():
+            self.slvDlBar[slv].setFormat(f'{slv}: ' + ('ok' if ok else 'failed'))
+            self.slvDlBar[slv].setStyleSheet('' if ok else self.RedLabel)
+            regCache.invalidate(slv) # new firmware, re-read the slaves
+        self.getSlaveInfo()
+
+    def downloadFinished(self, slv, ok): # slv is the flashed slave, the selection may have changed since
+        self.pollScheduler.resume()
+        self.rpdStartButton.setEnabled(True)
+        self.rpdStartButton.setStyleSheet(self.GreenLabel if ok else self.RedLabel)
+        regCache.invalidate(slv) # new or partly erased firmware, re-read the slave
+        if slv == self.slv:
+            self.getSlaveInfo() # update slave information
+
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
     main = Usb2Bsat()
     main.show()
-    sys.exit(app.exec_())
+    code = app.exec_()
+    if errMonitor.historyFile:
+        errMonitor.save(errMonitor.historyFile)
+    sys.exit(code)
@@ -1,9 +1,10 @@
 #!/usr/bin/env python
 
 import u2b_base as u2b
+import u2b_flash
 import sys
 import os
-import time
+import threading
 from PyQt5.QtWidgets import (QApplication, QPushButton, QWidget, QCheckBox, QRadioButton, QProgressBar, QHBoxLayout, QVBoxLayout, QGridLayout, QGroupBox, QLabel, QFileDialog)
 from PyQt5.QtGui import QIcon
 from PyQt5.QtCore import QTimer, pyqtSignal, Qt
@@ -29,10 +30,14 @@ BSAT_WR_DL_ADDR = 27
 BSAT_BOARD_TYPE = 83
 BSAT_NODE_INFO = 99
 
-dev =u2b.openFTDI()
+# Open FTDI device, only the worker thread talks to it
+worker = u2b.DeviceWorker(u2b.openFTDI())
 
 
 class DownloadApp(QWidget):
+    # results of the download job, emitted from the worker side
+    dlProgress = pyqtSignal(int)
+    dlDone = pyqtSignal(bool)
 
     def __init__(self):
         super().__init__()
@@ -62,6 +67,8 @@ class DownloadApp(QWidget):
         mainLayout.setColumnStretch(0, 1)
         self.setLayout(mainLayout)
 
+        self.dlProgress.connect(self.rpdDlBar.setValue)
+        self.dlDone.connect(self.downloadFinished)
         self.updateInfo()
 
     def createInfoGroupBox(self):
@@ -135,40 +142,38 @@ class DownloadApp(QWidget):
             head, tail = os.path.split(self.rpdFileName[0])
             self.rpdLblFileName.setText(tail)
 
-    def readSPort(self, addr): # returns integer value of 16bit
-        u2b.write_cmd_bytes(dev, CMD_OUT, [addr, 0, 0]) # set Address
-        u2b.write_cmd_bytes(dev, CMD_INOUT, [addr, 0, 0]) # read Address
-        rx = u2b.read(dev, 3)
-        return(rx[1] * (2**8) + rx[2])
-
-    def writeSPort(self, addr, hByte, lByte):
-        u2b.write_cmd_bytes(dev, CMD_OUT, [addr, hByte, lByte]) # set Address
+    def readSPortList(self, dev, addrs): # returns list of 16bit integers
+        t = u2b.Transaction(dev)
+        t.cmdOut([addrs[0], 0, 0]) # set first Address
+        for addr in addrs[1:] + addrs[-1:]: # data of previous address comes back with the next one
+            t.cmdInOut([addr, 0, 0])
+        rx = t.flush()
+        return [rx[i + 1] * (2**8) + rx[i + 2] for i in range(0, len(rx), 3)]
 
     def updateInfo(self):
         brdType = ""
         brdNmbr = ""
         mem = []
-        u2b.activate_CS1_n(dev)
-        for i in range(16):  # read memory
-            word = self.readSPort(BSAT_BOARD_TYPE + i)
+        addrs = list(range(BSAT_BOARD_TYPE, BSAT_BOARD_TYPE + 16)) + [BSAT_NODE_INFO, BSAT_UID0, BSAT_UID1]
+        words = worker.call(u2b.onCS1, self.readSPortList, addrs)
+        for word in words[:16]:  # read memory
             hByte = word >> 8
             lByte = word & 0x00FF
             mem.append(hByte)
             mem.append(lByte)
-        nodeInfo = self.readSPort(BSAT_NODE_INFO)
+        nodeInfo = words[16]
         if (nodeInfo & 1 << 0):
             self.valSysInfo.setText('Auxiliary')
         else:
             self.valSysInfo.setText('Standard')
         self.numOfPorts = (nodeInfo & 0x00F0) // 16 # upper 4 bits
         self.valPorts.setText(f'{self.numOfPorts}')
-        uID_0 = self.readSPort(BSAT_UID0)
+        uID_0 = words[17]
         featureID = uID_0 & 0x00FF
         self.valFeature.setText(f'{featureID}')
-        uID_1 = self.readSPort(BSAT_UID1)
+        uID_1 = words[18]
         bugFix = uID_1 >> 8
         self.valBugfix.setText(f'{bugFix}')
-        u2b.reset_CSx_n(dev)
         for x in range(0, 16):  # convert to string Board Type
             if mem[x]:
                 brdType += chr(mem[x])
@@ -182,65 +187,27 @@ class DownloadApp(QWidget):
     def downloadSelf(self, sys):
         self.rpdStartButton.setStyleSheet(self.OrgLabel)
         if (self.rpdFileName[0]):
-            u2b.activate_CS1_n(dev)
-            # ****** Erase Section ******
-            self.writeSPort(BSAT_CTRL0, 0xFF, sys)  # Erase Sequence 1
-            self.writeSPort(BSAT_CTRL0, 0xDA, sys)  # Erase Sequence 2
-            self.writeSPort(BSAT_CTRL0, 0x91, sys)  # Erase Sequence 3
-            self.writeSPort(BSAT_CTRL0, 0x20, sys)  # Erase Sequence 4
-            self.writeSPort(BSAT_CTRL0, 0xC0, sys)  # Erase Sequence 5
-            self.writeSPort(BSAT_CTRL0, 0x87, sys)  # Erase Sequence 6
-            self.writeSPort(BSAT_CTRL0, 0xAA, sys)  # Erase Sequence 7
-            self.writeSPort(BSAT_CTRL0, 0xAA, sys + (1 << 0))  # Erase Request
-            timeout = 5 # seconds
-            timeout_start = time.time()
-            while time.time() < timeout_start + timeout:
-                nMode_1 = self.readSPort(BSAT_MODE1)
-                if (nMode_1 & 1 << 15): # erase done?
-                    break
-            else: # erase timeout
-                self.rpdStartButton.setStyleSheet(self.RedLabel)
-                u2b.reset_CSx_n(dev)
-                return
-            # ****** Download Section ******
-            dl_prog = 0
-            rpdDlBarMax = (os.stat(self.rpdFileName[0]).st_size) # get download file size in bytes
-            with open(self.rpdFileName[0], 'rb') as in_file:
-                while True:
-                    rpdDlBarAct = dl_prog
-                    self.rpdDlBar.setValue(int(100 / rpdDlBarMax * rpdDlBarAct))
-                    dl_prog += 2 # we write 2 bytes at a time
-                    byte = in_file.read(2)
-                    if len(byte) == 0: # all written
-                        break
-                    self.writeSPort(BSAT_WR_DL_ADDR, byte[0], byte[1])  # Firmware Download
-            self.writeSPort(BSAT_CTRL0, 0x00, sys + (1 << 3))  # Download Data End
-            timeout_start = time.time()
-            while time.time() < timeout_start + timeout:
-                nMode_1 = self.readSPort(BSAT_MODE1)
-                if (nMode_1 & 1 << 14): # download done?
-                    break
-            else: # prog timeout
-                self.rpdStartButton.setStyleSheet(self.RedLabel)
-                u2b.reset_CSx_n(dev)
-                return
-            # ****** Reboot Section ******
-            self.writeSPort(BSAT_CTRL0, 0x91, sys)  # Reboot Sequence 1
-            self.writeSPort(BSAT_CTRL0, 0x20, sys)  # Reboot Sequence 2
-            self.writeSPort(BSAT_CTRL0, 0xC0, sys)  # Reboot Sequence 3
-            self.writeSPort(BSAT_CTRL0, 0x87, sys)  # Reboot Sequence 4
-            self.writeSPort(BSAT_CTRL0, 0xAA, sys)  # Reboot Sequence 5
-            self.writeSPort(BSAT_CTRL0, 0xF1, sys)  # Reboot Sequence 6
-            self.writeSPort(BSAT_CTRL0, 0x60, sys)  # Reboot Sequence 7
-            self.writeSPort(BSAT_CTRL0, 0x00, sys + (1 << 1))  # Reboot !
-            u2b.reset_CSx_n(dev)
-            time.sleep(1) # wait for reboot
-            self.rpdStartButton.setStyleSheet(self.GreenLabel)
-            self.updateInfo
+            self.rpdStartButton.setEnabled(False)
+            threading.Thread(target=self.downloadThread, args=(sys, self.rpdFileName[0]), daemon=True).start()
         else:
             self.rpdLblFileName.setText("select rpd File first !")
 
-
+    def downloadFinished(self, ok):
+        self.rpdStartButton.setEnabled(True)
+        if ok:
+            self.rpdStartButton.setStyleSheet(self.GreenLabel)
+            self.updateInfo()
+        else:
+            self.rpdStartButton.setStyleSheet(self.RedLabel)
+
+    def downloadThread(self, sys, fileName): # off the GUI thread, results come back by signals
+        ok = False
+        try:
+            ok = u2b_flash.flashAdapter(worker, sys >> 4, fileName, self.dlProgress.emit)
+        except Exception as e: # USB error, file gone, ...
+            print(f'download failed: {e}')
+        finally:
+            self.dlDone.emit(ok) # re-enables start
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)